@@ -0,0 +1,257 @@
+"""
+Admission control for LLM-backed endpoints.
+
+Two layers keep a traffic spike from turning into a wall of upstream 429s and
+timeouts:
+
+- Token buckets per authenticated user and, for anonymous callers, per client
+  IP. A caller over its rate gets 429 with Retry-After before any work is done.
+  Batch requests are charged one token per message.
+- A process-wide limiter on upstream LLM calls (cache hits and local answers
+  never take a slot). Calls beyond ``llm_max_concurrency`` wait in a bounded
+  priority queue where authenticated users go ahead of anonymous callers;
+  when the queue is full, or the wait exceeds ``llm_queue_timeout_seconds``,
+  the call fails fast with 503 and Retry-After.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from fastapi import Depends, HTTPException, Request, status
+from . import auth, models
+from .config import settings
+
+PRIORITY_USER = 0
+PRIORITY_ANONYMOUS = 1
+
+# Queue priority of the current request's LLM calls; set by ``admit``
+current_priority: ContextVar[int] = ContextVar("admission_priority", default=PRIORITY_USER)
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by caller: ``burst`` tokens, refilled continuously at
+    ``per_minute``. The least recently seen keys are dropped past ``max_keys``
+    (a dropped caller simply starts again with a full bucket).
+    """
+
+    def __init__(self, per_minute: float, burst: int, max_keys: int):
+        self.per_minute = per_minute
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (tokens, last refill)
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    def take(self, key: str, cost: float = 1.0) -> float:
+        """Spend ``cost`` tokens; returns 0 if allowed, else seconds until they would be available."""
+        rate = self.per_minute / 60.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+                self.allowed += 1
+            else:
+                wait = (cost - tokens) / rate if rate > 0 else 60.0
+                self.limited += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "per_minute": self.per_minute,
+            "burst": self.burst,
+            "tracked_keys": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+class PriorityLimiter:
+    """
+    Concurrency limit with a bounded wait queue ordered by priority, then
+    arrival. A freed slot goes straight to the best waiter. When the queue is
+    full, a better-priority arrival evicts the worst waiter instead of being
+    refused. Runs on the event loop; not thread-safe.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, timeout: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: List[list] = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self._average_seconds = 1.0  # EWMA of how long a slot is held
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.shed = 0
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained."""
+        return max(1, math.ceil(self._average_seconds * (len(self._waiters) + 1) / self.max_concurrent))
+
+    def _overloaded(self) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The assistant is at capacity, please retry shortly",
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    def _remove(self, entry: list) -> None:
+        try:
+            self._waiters.remove(entry)
+        except ValueError:
+            return
+        heapq.heapify(self._waiters)
+
+    async def acquire(self, priority: int) -> None:
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            worst = max(self._waiters, default=None)
+            if worst is None or worst[0] <= priority:
+                self.rejected += 1
+                raise self._overloaded()
+            self._remove(worst)
+            worst[2].set_exception(self._overloaded())
+            self.shed += 1
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), future]
+        heapq.heappush(self._waiters, entry)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._remove(entry)
+            self.timed_out += 1
+            raise self._overloaded()
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(0.0)  # The slot was handed over just as the caller went away
+            else:
+                self._remove(entry)
+            raise
+
+    def release(self, held_seconds: float) -> None:
+        if held_seconds:
+            self._average_seconds = 0.9 * self._average_seconds + 0.1 * held_seconds
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                future.set_result(None)  # Hand the slot over; ``active`` is unchanged
+                self.admitted += 1
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None):
+        """Hold one slot for the duration of the block (no-op when admission is disabled)."""
+        if not settings.admission_enabled:
+            yield
+            return
+        await self.acquire(current_priority.get() if priority is None else priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "shed": self.shed,
+            "average_seconds": round(self._average_seconds, 3),
+        }
+
+
+llm_limiter = PriorityLimiter(settings.llm_max_concurrency, settings.llm_max_queue, settings.llm_queue_timeout_seconds)
+user_limiter = RateLimiter(settings.rate_limit_user_per_minute, settings.rate_limit_user_burst, settings.rate_limit_max_keys)
+ip_limiter = RateLimiter(settings.rate_limit_ip_per_minute, settings.rate_limit_ip_burst, settings.rate_limit_max_keys)
+
+
+def client_ip(request: Request) -> str:
+    """Peer address (run uvicorn with --proxy-headers behind a reverse proxy)."""
+    return request.client.host if request.client else "unknown"
+
+
+def _caller(request: Request, current_user: Optional[models.User]) -> Tuple[RateLimiter, str, int]:
+    """The token bucket (per user, or per IP when anonymous) and queue priority for a caller."""
+    if current_user is not None:
+        return user_limiter, f"user:{current_user.id}", PRIORITY_USER
+    return ip_limiter, f"ip:{client_ip(request)}", PRIORITY_ANONYMOUS
+
+
+def rate_limited(wait: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Rate limit exceeded, please slow down",
+        headers={"Retry-After": str(max(1, math.ceil(wait)))},
+    )
+
+
+async def admit(
+    request: Request,
+    current_user: Optional[models.User] = Depends(auth.get_current_user_optional),
+) -> None:
+    """
+    Route dependency: charge the caller's token bucket (per user, or per IP when
+    anonymous) and set the queue priority of the request's LLM calls.
+    """
+    if not settings.admission_enabled:
+        return
+    limiter, key, priority = _caller(request, current_user)
+    wait = limiter.take(key)
+    if wait:
+        raise rate_limited(wait)
+    current_priority.set(priority)
+
+
+async def admit_each(
+    request: Request,
+    current_user: Optional[models.User] = Depends(auth.get_current_user_optional),
+) -> Callable[[], float]:
+    """
+    Route dependency for batch endpoints: set the queue priority like ``admit``
+    and return a function that charges the caller's bucket one token per item
+    (0 if allowed, else seconds until a token is available).
+    """
+    if not settings.admission_enabled:
+        return lambda: 0.0
+    limiter, key, priority = _caller(request, current_user)
+    current_priority.set(priority)
+    return lambda: limiter.take(key)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "enabled": settings.admission_enabled,
+        "llm": llm_limiter.stats(),
+        "users": user_limiter.stats(),
+        "ips": ip_limiter.stats(),
+    }
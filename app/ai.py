@@ -4,82 +4,441 @@ Handles LLM-based decision making for user queries.
 """
 
 import json
-import httpx
-from typing import Dict, Any, Optional
+import re
+import threading
+import time
+import numpy as np
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, Any, Iterable, List, Optional, Tuple
+from . import admission, metrics, providers, resilience, retrieval
 from .config import settings
 from .schemas import TicketCreate
+from .cache import SingleFlight, build_decision_cache, make_cache_key
 
+# Bump whenever SYSTEM_PROMPT changes so cached decisions from the old prompt are ignored
+PROMPT_VERSION = "1"
 
-async def call_groq_api(message: str) -> Dict[str, Any]:
+SYSTEM_PROMPT = """You are Helpdesk-AI. Reply only in JSON matching: {"action":"answer|escalate","confidence":number,"short_title":string,"reply_text":string}
+
+For common IT issues (password resets, basic troubleshooting, software questions), provide helpful answers with high confidence (0.8-1.0).
+For complex, specific, or unclear issues, choose "escalate" with a descriptive short_title for the ticket."""
+
+# Messages that always need a human; (pattern, ticket title)
+ESCALATION_RULES = [
+    (r"\b(screen|display|monitor)\b.*\b(cracked|shattered|smashed)\b"
+     r"|\b(cracked|shattered|smashed)\b.*\b(screen|display|monitor)\b", "Damaged display"),
+    (r"\b(new|replacement|replace|lost|stolen|expired)\b.*\bbadge\b"
+     r"|\bbadge\b.*\b(lost|stolen|broken|expired|stopped working)\b", "Badge request"),
+    (r"\b(spill|spilled|spilt)\b.*\b(laptop|keyboard|computer|phone)\b"
+     r"|\b(laptop|keyboard|computer|phone)\b.*\b(spill|spilled|spilt)\b", "Liquid damage"),
+    (r"\b(lost|stolen)\b.*\b(laptop|phone|tablet|device)\b"
+     r"|\b(laptop|phone|tablet|device)\b.*\b(lost|stolen)\b", "Lost or stolen device"),
+]
+
+decision_cache = build_decision_cache()
+inflight_decisions = SingleFlight()
+
+class PreRouter:
     """
-    Call Groq API to analyze user message and decide action.
+    Cheap local classifier consulted before the LLM.
+
+    Keyword rules fire first: built-in ESCALATION_RULES plus optional rules from
+    ``router_rules_path`` (a JSON list of {pattern, action, short_title,
+    reply_text}; "answer" rules must carry reply_text). Then a logistic
+    regression over hashed word n-grams, trained offline from stored
+    ``Message.ai_action`` labels, escalates when P(escalate) reaches
+    ``router_escalate_threshold``. The model can only say *that* a message is
+    answerable, not *what* to answer, so confident answer predictions still
+    go to the LLM and are only counted.
+    """
+
+    def __init__(self):
+        self.rules: List[Tuple[re.Pattern, Dict[str, Any]]] = []
+        self.weights: Optional[np.ndarray] = None
+        self.bias = 0.0
+        self.model_info: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.consulted = 0
+        self.rule_escalations = 0
+        self.rule_answers = 0
+        self.model_escalations = 0
+        self.confident_answers = 0
+        self.deferred = 0
+        self.set_rules([])
+
+    def set_rules(self, extra: Iterable[Dict[str, Any]]) -> None:
+        rules = [
+            (re.compile(pattern, re.IGNORECASE), {"action": "escalate", "short_title": title, "reply_text": ""})
+            for pattern, title in ESCALATION_RULES
+        ]
+        for rule in extra:
+            action = rule.get("action", "escalate")
+            if action not in ("answer", "escalate") or (action == "answer" and not rule.get("reply_text")):
+                raise ValueError(f"Invalid router rule: {rule!r}")
+            rules.append((re.compile(rule["pattern"], re.IGNORECASE), {
+                "action": action,
+                "short_title": rule.get("short_title") or "Support Issue",
+                "reply_text": rule.get("reply_text", ""),
+            }))
+        self.rules = rules
+
+    def load(self, model_path: str = "", rules_path: str = "") -> None:
+        if rules_path:
+            with open(rules_path, encoding="utf-8") as f:
+                self.set_rules(json.load(f))
+        if model_path:
+            try:
+                with np.load(model_path) as data:
+                    self.weights = data["weights"].astype(np.float32)
+                    self.bias = float(data["bias"])
+                    self.model_info = json.loads(str(data["info"]))
+            except FileNotFoundError:
+                print(f"⚠️  Router model {model_path} not found; using keyword rules only")
+
+    @staticmethod
+    def _vectorize(features_list: List[Dict[int, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """CSR-style (row of each nonzero, feature index, value) with sublinear, L2-normalized tf."""
+        rows, cols, vals = [], [], []
+        for row, counts in enumerate(features_list):
+            if not counts:
+                continue
+            weights = np.array([1.0 + np.log(c) for c in counts.values()], dtype=np.float32)
+            weights /= np.linalg.norm(weights)
+            rows.extend([row] * len(counts))
+            cols.extend(counts.keys())
+            vals.extend(weights)
+        return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), np.array(vals, dtype=np.float32)
+
+    def probability(self, message: str) -> Optional[float]:
+        """Model P(escalate) for a message, or None without a trained model."""
+        if self.weights is None:
+            return None
+        _, cols, vals = self._vectorize([retrieval.features(message)])
+        logit = float(np.dot(self.weights[cols], vals)) + self.bias
+        return float(1.0 / (1.0 + np.exp(-logit)))
+
+    def train(self, examples: List[Tuple[str, str]], epochs: int = 300, lr: float = 2.0, l2: float = 1e-4) -> Dict[str, Any]:
+        """
+        Fit the model on (message, action) pairs by full-batch gradient descent
+        with balanced class weights; returns training metrics.
+        """
+        labelled = [(m, 1.0 if a == "escalate" else 0.0) for m, a in examples if a in ("answer", "escalate")]
+        if len({y for _, y in labelled}) < 2:
+            raise ValueError("Training needs both answered and escalated examples")
+        rows, cols, vals = self._vectorize([retrieval.features(m) for m, _ in labelled])
+        y = np.array([label for _, label in labelled], dtype=np.float32)
+        n = len(y)
+        positives = float(y.sum())
+        sample_weight = np.where(y == 1, n / (2 * positives), n / (2 * (n - positives))).astype(np.float32)
+
+        weights = np.zeros(retrieval.DIM, dtype=np.float32)
+        bias = 0.0
+        for _ in range(epochs):
+            logits = np.bincount(rows, weights=weights[cols] * vals, minlength=n) + bias
+            error = (1.0 / (1.0 + np.exp(-logits)) - y) * sample_weight
+            weights -= lr * (np.bincount(cols, weights=vals * error[rows], minlength=retrieval.DIM) / n + l2 * weights)
+            bias -= lr * float(error.mean())
+
+        logits = np.bincount(rows, weights=weights[cols] * vals, minlength=n) + bias
+        predicted = 1.0 / (1.0 + np.exp(-logits))
+        confident = predicted >= settings.router_escalate_threshold
+        with self._lock:
+            self.weights, self.bias = weights, bias
+            self.model_info = {
+                "examples": n,
+                "escalations": int(positives),
+                "train_accuracy": round(float(((predicted >= 0.5) == (y == 1)).mean()), 4),
+                "would_skip": int(confident.sum()),
+                "skip_precision": round(float(y[confident].mean()), 4) if confident.any() else None,
+            }
+        return dict(self.model_info)
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, weights=self.weights, bias=np.float32(self.bias), info=json.dumps(self.model_info))
+
+    def route(self, message: str) -> Optional[Dict[str, Any]]:
+        """A local decision for ``message``, or None to ask the LLM."""
+        if not settings.router_enabled:
+            return None
+        self.consulted += 1
+        for pattern, rule in self.rules:
+            if pattern.search(message):
+                if rule["action"] == "answer":
+                    self.rule_answers += 1
+                    confidence = 1.0
+                else:
+                    self.rule_escalations += 1
+                    confidence = 0.0
+                return {**rule, "confidence": confidence, "source": "router"}
+
+        p_escalate = self.probability(message)
+        if p_escalate is not None:
+            if p_escalate >= settings.router_escalate_threshold:
+                self.model_escalations += 1
+                return {
+                    "action": "escalate",
+                    "confidence": round(1.0 - p_escalate, 4),
+                    "short_title": _title_from_message(message),
+                    "reply_text": "",
+                    "source": "router",
+                }
+            if p_escalate <= 1.0 - settings.router_escalate_threshold:
+                self.confident_answers += 1
+        self.deferred += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        skipped = self.rule_escalations + self.rule_answers + self.model_escalations
+        return {
+            "enabled": settings.router_enabled,
+            "model": self.model_info or None,
+            "rules": len(self.rules),
+            "consulted": self.consulted,
+            "skipped_llm_calls": skipped,
+            "rule_escalations": self.rule_escalations,
+            "rule_answers": self.rule_answers,
+            "model_escalations": self.model_escalations,
+            "confident_answers_sent_to_llm": self.confident_answers,
+            "deferred": self.deferred,
+            "skip_ratio": round(skipped / self.consulted, 4) if self.consulted else 0.0,
+        }
+
+
+def _title_from_message(message: str) -> str:
+    title = " ".join(message.split())
+    return title[:50] + "..." if len(title) > 50 else title or "Support Issue"
+
+
+router = PreRouter()
+
+
+def _prompt_key(context_ids: List[int]) -> str:
+    """Prompt version for cache keys; retrieved context changes the prompt too."""
+    if not context_ids:
+        return PROMPT_VERSION
+    return f"{PROMPT_VERSION}+tickets:{','.join(map(str, context_ids))}"
+
+
+async def get_decision(message: str) -> Dict[str, Any]:
+    """
+    Return the AI decision for a message.
     
-    Returns dict with: action, confidence, short_title, reply_text
-    Raises exception if API fails or no API key configured.
+    A close match among resolved tickets answers without the LLM, then the
+    local pre-router may decide. Otherwise the decision cache is consulted,
+    and concurrent requests for the same normalized message share one upstream
+    call, which waits for an admission slot (503 when overloaded). Only
+    successful decisions are cached; API failures propagate to every waiting
+    caller unchanged.
     """
-    if not settings.groq_api_key:
-        raise ValueError("GROQ_API_KEY not configured")
+    known = retrieval.answer_for(message) or router.route(message)
+    if known is not None:
+        metrics.observe_decision(known, known.get("source", "router"))
+        return known
+
+    context, context_ids = retrieval.context_for(message)
+    key = make_cache_key(message, providers.chain.primary.name, _prompt_key(context_ids))
+    cached = decision_cache.get(key)
+    if cached is not None:
+        metrics.observe_decision(cached, "cache")
+        return cached
+
+    async def decide() -> Dict[str, Any]:
+        async with admission.llm_limiter.slot():
+            decision = await call_llm(message, context=context)
+        _cache_decision(key, decision)
+        return decision
+
+    decision = await inflight_decisions.do(key, decide)
+    metrics.observe_decision(decision, "llm")
+    return dict(decision)
+
+
+def _cache_decision(key: str, decision: Dict[str, Any]) -> None:
+    """
+    Cache a fresh LLM decision under ``key`` (built for the primary model).
+    Answers from a fallback model are not cached, so they stop being served
+    as soon as the primary recovers.
+    """
+    if decision.get("model") == providers.chain.primary.name:
+        decision_cache.set(key, decision)
+
+
+def _build_messages(message: str, context: str = "") -> List[Dict[str, str]]:
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if context:
+        messages.append({"role": "system", "content": context})
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def _normalize_decision(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill in missing or mistyped decision fields with safe defaults."""
+    if not isinstance(result.get("action"), str):
+        result["action"] = "escalate"
+    else:
+        result["action"] = result["action"].lower()
+        
+    if not isinstance(result.get("confidence"), (int, float)):
+        result["confidence"] = 0.0
+    
+    if not isinstance(result.get("reply_text"), str):
+        result["reply_text"] = ""
+        
+    if not isinstance(result.get("short_title"), str):
+        result["short_title"] = "Support Issue"
     
-    system_prompt = """You are Helpdesk-AI. Reply only in JSON matching: {"action":"answer|escalate","confidence":number,"short_title":string,"reply_text":string}
+    return result
 
-For common IT issues (password resets, basic troubleshooting, software questions), provide helpful answers with high confidence (0.8-1.0).
-For complex, specific, or unclear issues, choose "escalate" with a descriptive short_title for the ticket."""
 
-    payload = {
-        "model": settings.groq_model,
-        "temperature": 0,
-        "response_format": {"type": "json_object"},
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message}
-        ]
-    }
+async def call_llm(message: str, context: str = "") -> Dict[str, Any]:
+    """
+    Ask the configured provider chain to analyze user message and decide action.
     
-    headers = {
-        "Authorization": f"Bearer {settings.groq_api_key}",
-        "Content-Type": "application/json"
-    }
+    ``context`` (e.g. similar resolved tickets) is sent as an extra system message.
+    Returns dict with: action, confidence, short_title, reply_text, and model
+    (the provider that answered).
+    Raises ValueError if no API key is configured, LLMUnavailable while every
+    model in the chain is unhealthy (circuit open, or 429/5xx/timeouts
+    persisting through retries) and LLMError for any other failure.
+    """
+    start = time.perf_counter()
+    try:
+        model, content = await providers.chain.complete(_build_messages(message, context))
+
+        # Parse the JSON response
+        result = safe_parse_json(content)
+        if not result:
+            raise resilience.LLMError("Failed to parse AI response as JSON")
+    except Exception:
+        metrics.llm_call_duration.observe(time.perf_counter() - start, outcome="error")
+        raise
+
+    decision = _normalize_decision(result)
+    decision["model"] = model
+    metrics.llm_call_duration.observe(time.perf_counter() - start, outcome=_outcome(decision))
+    return decision
+
+
+def _outcome(decision: Dict[str, Any]) -> str:
+    return "answer" if decision["action"] == "answer" else "escalate"
+
+
+class ReplyTextExtractor:
+    """
+    Incrementally pull the ``reply_text`` string value out of a JSON object
+    that is arriving in fragments, so it can be forwarded as it is generated.
+    """
+
+    _KEY_RE = re.compile(r'"reply_text"\s*:\s*"')
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos: Optional[int] = None  # Index of the next unread char inside the string
+        self.done = False
+
+    def feed(self, fragment: str) -> str:
+        """Add a raw fragment and return any newly decoded reply text."""
+        if self.done:
+            return ""
+        self._buffer += fragment
+        if self._pos is None:
+            match = self._KEY_RE.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        out = []
+        buf, i = self._buffer, self._pos
+        while i < len(buf):
+            char = buf[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char != "\\":
+                out.append(char)
+                i += 1
+                continue
+            # Escape sequence: wait until it is complete before decoding
+            length = 6 if buf[i + 1:i + 2] == "u" else 2
+            if i + length > len(buf):
+                break
+            try:
+                out.append(json.loads(f'"{buf[i:i + length]}"'))
+            except json.JSONDecodeError:
+                pass
+            i += length
+        self._pos = i
+        return "".join(out)
+
+
+async def stream_llm(message: str, context: str = "") -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Stream a decision from the configured provider chain.
     
+    Yields ("token", text) for each fragment of reply_text as it arrives, then a
+    single ("decision", dict) with the same fields as call_llm. Closing the
+    generator early closes the upstream response, so no further tokens are spent.
+    Failures are retried, or passed to the next model, only until the first
+    fragment arrives.
+    """
+    extractor = ReplyTextExtractor()
+    content = []
+    model = None
+    start = time.perf_counter()
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                json=payload,
-                headers=headers
-            )
-            response.raise_for_status()
-            
-            data = response.json()
-            content = data["choices"][0]["message"]["content"]
-            
-            # Parse the JSON response
-            result = safe_parse_json(content)
-            if not result:
-                raise Exception("Failed to parse AI response as JSON")
-            
-            # Normalize and validate fields
-            if not isinstance(result.get("action"), str):
-                result["action"] = "escalate"
-            else:
-                result["action"] = result["action"].lower()
-                
-            if not isinstance(result.get("confidence"), (int, float)):
-                result["confidence"] = 0.0
-            
-            if not isinstance(result.get("reply_text"), str):
-                result["reply_text"] = ""
-                
-            if not isinstance(result.get("short_title"), str):
-                result["short_title"] = "Support Issue"
-            
-            return result
-            
-    except httpx.HTTPStatusError as e:
-        raise Exception(f"Groq API error: {e.response.status_code} - {e.response.text}")
-    except httpx.TimeoutException:
-        raise Exception("Groq API timeout")
-    except Exception as e:
-        raise Exception(f"Failed to call Groq API: {str(e)}")
+        async with aclosing(providers.chain.stream(_build_messages(message, context))) as fragments:
+            async for model, fragment in fragments:
+                content.append(fragment)
+                text = extractor.feed(fragment)
+                if text:
+                    yield "token", text
+
+        result = safe_parse_json("".join(content))
+        if not result:
+            raise resilience.LLMError("Failed to parse AI response as JSON")
+    except Exception:
+        metrics.llm_call_duration.observe(time.perf_counter() - start, outcome="error")
+        raise
+
+    decision = _normalize_decision(result)
+    decision["model"] = model
+    metrics.llm_call_duration.observe(time.perf_counter() - start, outcome=_outcome(decision))
+    yield "decision", decision
+
+
+async def stream_decision(message: str) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming counterpart of get_decision.
+    
+    A resolved-ticket answer, pre-router decision or cached decision is replayed
+    as a single token; a freshly streamed one is cached once the stream completes.
+    """
+    known = retrieval.answer_for(message) or router.route(message)
+    if known is not None:
+        metrics.observe_decision(known, known.get("source", "router"))
+        if known["reply_text"]:
+            yield "token", known["reply_text"]
+        yield "decision", known
+        return
+
+    context, context_ids = retrieval.context_for(message)
+    key = make_cache_key(message, providers.chain.primary.name, _prompt_key(context_ids))
+    cached = decision_cache.get(key)
+    if cached is not None:
+        metrics.observe_decision(cached, "cache")
+        if cached["reply_text"]:
+            yield "token", cached["reply_text"]
+        yield "decision", cached
+        return
+
+    async with admission.llm_limiter.slot():
+        async with aclosing(stream_llm(message, context=context)) as events:
+            async for kind, value in events:
+                if kind == "decision":
+                    _cache_decision(key, value)
+                    metrics.observe_decision(value, "llm")
+                yield kind, value
 
 
 def safe_parse_json(content: str) -> Dict[str, Any] | None:
@@ -98,7 +457,6 @@ def safe_parse_json(content: str) -> Dict[str, Any] | None:
         return json.loads(content)
     except json.JSONDecodeError:
         # Try to extract first {...} block
-        import re
         match = re.search(r'\{[^}]*\}', content)
         if match:
             try:
@@ -113,16 +471,28 @@ def safe_parse_json(content: str) -> Dict[str, Any] | None:
 def should_answer_directly(decision: Dict[str, Any]) -> bool:
     """
     Determine if we should provide AI answer or escalate to ticket.
+    Local answers (resolved tickets, router rules) already passed their own bar.
     """
     action = decision.get("action", "").lower()
     confidence = decision.get("confidence", 0.0)
     
     return (
         action == "answer" and 
-        confidence >= settings.confidence_threshold
+        (confidence >= settings.confidence_threshold or decision.get("source") in ("retrieval", "router"))
     )
 
 
+def chat_reply_from_decision(decision: Dict[str, Any]) -> Tuple[str, str, float]:
+    """
+    Turn an AI decision into the (response, action, confidence) shown by the chat endpoints.
+    """
+    confidence = decision.get("confidence", 0.0)
+    if should_answer_directly(decision):
+        return decision.get("reply_text", "I'm here to help!"), "answer", confidence
+    title = decision.get("short_title", "Support Issue")
+    return f"I'd recommend creating a support ticket for: {title}", "escalate", confidence
+
+
 def create_ticket_from_decision(original_message: str, decision: Dict[str, Any]) -> TicketCreate:
     """
     Create a TicketCreate object from the AI decision and original message.
@@ -2,23 +2,38 @@
 Authentication utilities for Helpdesk-AI.
 """
 
+import asyncio
+import hashlib
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Union, Optional
+from typing import Any, Callable, Dict, Union, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, event, select
+from sqlalchemy.orm import Session, object_session
 from . import models, schemas
+from .cache import TTLCache
 from .config import settings
 from .db import SessionLocal
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing; hashes with a different cost factor report needs_update
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 
 # JWT token handling
 security = HTTPBearer()
 
+# Resolved principals keyed by (user id, token fingerprint), and decoded tokens
+# keyed by fingerprint so repeat requests skip signature verification
+_auth_cache_size = settings.auth_cache_max_entries if settings.auth_cache_enabled else 0
+principal_cache = TTLCache(_auth_cache_size, settings.auth_cache_ttl_seconds)
+token_cache = TTLCache(_auth_cache_size, settings.access_token_expire_hours * 3600)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -26,6 +41,83 @@ def get_db():
     finally:
         db.close()
 
+class PasswordPool:
+    """
+    Dedicated, size-limited thread pool for bcrypt.
+
+    Keeps slow hashing off the event loop and out of the shared threadpool that
+    serves sync endpoints. When every worker is busy and ``max_queue`` jobs are
+    already waiting, new work is refused with 429 and a Retry-After estimate.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.running = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self._busy_seconds = 0.0
+
+    @property
+    def queued(self) -> int:
+        return max(self.in_flight - self.running, 0)
+
+    def _average_seconds(self) -> float:
+        return self._busy_seconds / self.completed if self.completed else 0.25
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained."""
+        return max(1, math.ceil(self._average_seconds() * (self.queued + 1) / self.workers))
+
+    def _timed(self, fn: Callable[..., Any], *args) -> Any:
+        with self._lock:
+            self.running += 1
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self._busy_seconds += time.perf_counter() - start
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many sign-in attempts in progress, please retry shortly",
+                    headers={"Retry-After": str(self.retry_after())},
+                )
+            self.in_flight += 1
+            self.peak_queued = max(self.peak_queued, self.in_flight - self.workers)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, fn, *args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "bcrypt_rounds": settings.bcrypt_rounds,
+            "running": self.running,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self._average_seconds() * 1000, 2) if self.completed else 0.0,
+        }
+
+password_pool = PasswordPool(settings.password_hash_workers, settings.password_hash_max_queue)
+
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt."""
     return pwd_context.hash(password)
@@ -58,9 +150,8 @@ def get_user_by_id(db: Session, user_id: int) -> Optional[models.User]:
     """Get user by ID."""
     return db.query(models.User).filter(models.User.id == user_id).first()
 
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
-    """Create a new user."""
-    # Check if username or email already exists
+def ensure_user_available(db: Session, user: schemas.UserCreate) -> None:
+    """Raise 400 if the username or email is already registered."""
     if get_user_by_username(db, user.username):
         raise HTTPException(
             status_code=400,
@@ -71,19 +162,30 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
             status_code=400,
             detail="Email already registered"
         )
-    
-    hashed_password = hash_password(user.password)
+
+def insert_user(db: Session, user: schemas.UserCreate, hashed_password: str, role: str = "user") -> models.User:
     db_user = models.User(
         username=user.username,
         email=user.email,
         hashed_password=hashed_password,
-        role="user"  # Default role
+        role=role
     )
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
+def create_user(db: Session, user: schemas.UserCreate) -> models.User:
+    """Create a new user."""
+    ensure_user_available(db, user)
+    return insert_user(db, user, hash_password(user.password))
+
+async def create_user_async(db: Session, user: schemas.UserCreate, role: str = "user") -> models.User:
+    """Create a new user with DB work in the threadpool and bcrypt on the password pool."""
+    await run_in_threadpool(ensure_user_available, db, user)
+    hashed_password = await password_pool.run(hash_password, user.password)
+    return await run_in_threadpool(insert_user, db, user, hashed_password, role)
+
 def authenticate_user(db: Session, username: str, password: str) -> Optional[models.User]:
     """Authenticate a user with username and password."""
     user = get_user_by_username(db, username)
@@ -93,64 +195,197 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[mod
         return None
     return user
 
+async def authenticate_user_async(db: Session, username: str, password: str) -> Optional[models.User]:
+    """
+    Authenticate off the event loop, verifying on the password pool.
+
+    If the stored hash uses an outdated cost factor it is replaced with one
+    at the configured ``bcrypt_rounds``.
+    """
+    user = await run_in_threadpool(get_user_by_username, db, username)
+    if not user:
+        return None
+    verified, new_hash = await password_pool.run(
+        pwd_context.verify_and_update, password, user.hashed_password
+    )
+    if not verified:
+        return None
+    if new_hash:
+        def save_rehash():
+            user.hashed_password = new_hash
+            db.commit()
+            db.refresh(user)
+
+        await run_in_threadpool(save_rehash)
+    return user
+
+# ---------- Token revocation ----------
+
+class RevocationList:
+    """
+    Fingerprints of revoked tokens, checked in memory on every request.
+
+    Entries are persisted to ``revoked_tokens`` and loaded at startup so a
+    restart does not resurrect logged-out tokens; they are dropped once the
+    token would have expired anyway.
+    """
+
+    def __init__(self):
+        self._expiry: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, fingerprint: str) -> bool:
+        expires_at = self._expiry.get(fingerprint)
+        if expires_at is None:
+            return False
+        if expires_at <= time.time():
+            with self._lock:
+                self._expiry.pop(fingerprint, None)
+            return False
+        return True
+
+    def add(self, fingerprint: str, expires_at: float) -> None:
+        with self._lock:
+            self._expiry[fingerprint] = expires_at
+
+    def load(self, db: Session) -> int:
+        """Prune expired rows and load the rest; returns how many are active."""
+        now = int(time.time())
+        db.execute(delete(models.RevokedToken).where(models.RevokedToken.expires_at <= now))
+        db.commit()
+        rows = db.execute(select(models.RevokedToken.fingerprint, models.RevokedToken.expires_at)).all()
+        with self._lock:
+            self._expiry = {row.fingerprint: row.expires_at for row in rows}
+        return len(rows)
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+revoked_tokens = RevocationList()
+
+def token_fingerprint(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def revoke_token(db: Session, token: str) -> bool:
+    """Revoke a valid token until it expires; returns False if it was not valid."""
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return False
+    fingerprint = token_fingerprint(token)
+    expires_at = int(payload.get("exp") or time.time() + settings.access_token_expire_hours * 3600)
+    if db.get(models.RevokedToken, fingerprint) is None:
+        db.add(models.RevokedToken(fingerprint=fingerprint, expires_at=expires_at))
+        db.commit()
+    revoked_tokens.add(fingerprint, expires_at)
+    token_cache.discard_where(lambda key: key == fingerprint)
+    principal_cache.discard_where(lambda key: key[1] == fingerprint)
+    return True
+
+# ---------- Principal resolution ----------
+
+def invalidate_user(user_id: int) -> int:
+    """Forget every cached principal of ``user_id``."""
+    return principal_cache.discard_where(lambda key: key[0] == user_id)
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _user_changed(mapper, connection, target) -> None:
+    # Drop now, and again after commit in case a request re-cached the old row meanwhile
+    invalidate_user(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session) -> None:
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate_user(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session: Session) -> None:
+    session.info.pop("changed_user_ids", None)
+
+def auth_stats() -> dict:
+    return {
+        "principals": principal_cache.stats(),
+        "tokens": token_cache.stats(),
+        "revoked_tokens": len(revoked_tokens),
+    }
+
+def token_from_request(request: Request) -> Optional[str]:
+    """Bearer token from the Authorization header, falling back to the access_token cookie."""
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        return auth_header.split(" ", 1)[1]
+    return request.cookies.get("access_token")
+
+def decode_token(token: str, fingerprint: str) -> int:
+    """
+    Return the user id in a token, verifying the signature only on first sight.
+
+    Raises JWTError (or ValueError for a malformed subject).
+    """
+    user_id = token_cache.get(fingerprint)
+    if user_id is None:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        sub = payload.get("sub")
+        if not sub:
+            raise JWTError("Token has no subject")
+        user_id = int(sub)
+        token_cache.set(fingerprint, user_id, expires_at=payload.get("exp"))
+    return user_id
+
+def resolve_principal(db: Session, token: str) -> models.User:
+    """
+    Resolve a token to its user, serving repeat requests from memory.
+
+    The returned user is detached from ``db`` and shared between requests, so
+    callers must treat it as read-only.
+    """
+    fingerprint = token_fingerprint(token)
+    if fingerprint in revoked_tokens:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+    try:
+        user_id = decode_token(token, fingerprint)
+    except (JWTError, ValueError):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    key = (user_id, fingerprint)
+    user = principal_cache.get(key)
+    if user is None:
+        user = get_user_by_id(db, user_id=user_id)
+        if user is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        db.expunge(user)
+        principal_cache.set(key, user)
+    return user
+
 def get_current_user(
     request: Request,
     db: Session = Depends(get_db)
 ) -> models.User:
     """Get current authenticated user from Authorization header or access_token cookie."""
-    token: str | None = None
-    
-    # 1) Try Authorization header
-    auth_header = request.headers.get("Authorization")
-    if auth_header and auth_header.startswith("Bearer "):
-        token = auth_header.split(" ", 1)[1]
-    
-    # 2) Fallback to cookie
-    if not token:
-        token = request.cookies.get("access_token")
-
+    token = token_from_request(request)
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-
-    try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        user_id: str | None = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-
-    user = get_user_by_id(db, user_id=int(user_id))
-    if user is None:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    return resolve_principal(db, token)
 
 def get_current_user_optional(
     request: Request,
     db: Session = Depends(get_db)
 ) -> Optional[models.User]:
     """Get current authenticated user, but return None if not authenticated."""
-    # Try header
-    auth_header = request.headers.get("Authorization")
-    token: str | None = None
-    if auth_header and auth_header.startswith("Bearer "):
-        token = auth_header.split(" ", 1)[1]
-    # Try cookie
-    if not token:
-        token = request.cookies.get("access_token")
+    token = token_from_request(request)
     if not token:
         return None
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        user_id: str | None = payload.get("sub")
-        if not user_id:
-            return None
-        return get_user_by_id(db, user_id=int(user_id))
-    except Exception:
+        return resolve_principal(db, token)
+    except HTTPException:
         return None
 
 def get_current_admin_user(current_user: models.User = Depends(get_current_user)) -> models.User:
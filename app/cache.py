@@ -0,0 +1,330 @@
+"""
+Decision cache for Helpdesk-AI.
+Memoizes LLM decisions so repeated questions skip the Groq round trip.
+Also provides the small TTL cache used for authenticated principals.
+"""
+
+import asyncio
+import hashlib
+import json
+import queue
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from .config import settings
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a user message (case, punctuation, whitespace) for exact-match lookups."""
+    text = message.casefold()
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def make_cache_key(message: str, model: str, prompt_version: str) -> str:
+    """Build a cache key from the normalized message, model name and prompt version."""
+    raw = "\x1f".join([model, prompt_version, normalize_message(message)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DecisionCache(ABC):
+    """Interface for decision cache backends."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, decision: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> int:
+        """Drop every entry and return how many were removed."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+    def close(self) -> None:
+        """Release resources such as background writers (no-op by default)."""
+
+
+class NullDecisionCache(DecisionCache):
+    """Cache that never stores anything; used when caching is disabled."""
+
+    def __init__(self):
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        self.misses += 1
+        return None
+
+    def set(self, key: str, decision: Dict[str, Any]) -> None:
+        pass
+
+    def clear(self) -> int:
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": False, "size": 0, "hits": 0, "misses": self.misses, "hit_ratio": 0.0}
+
+
+class MemoryDecisionCache(DecisionCache):
+    """
+    In-memory LRU cache with per-entry TTL.
+
+    When ``path`` is given, entries are also kept in a small SQLite file so a
+    restarted worker starts warm: unexpired entries are preloaded here, and new
+    ones are written behind by a background thread, so lookups and stores never
+    touch the disk.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, path: str = ""):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()  # Serializes the writer thread with clear()
+        self._pending: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.preloaded = 0
+        self.evictions = 0
+
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS decision_cache "
+                "(key TEXT PRIMARY KEY, decision TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._disk.execute("DELETE FROM decision_cache WHERE expires_at <= ?", (time.time(),))
+            self._disk.commit()
+            rows = self._disk.execute(
+                "SELECT key, decision, expires_at FROM decision_cache ORDER BY expires_at DESC LIMIT ?",
+                (max_entries,),
+            ).fetchall()
+            for key, decision, expires_at in reversed(rows):  # Freshest end up most recently used
+                self._store(key, json.loads(decision), expires_at)
+            self.preloaded = len(rows)
+            self._writer = threading.Thread(target=self._write_behind, name="decision-cache-writer", daemon=True)
+            self._writer.start()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, decision = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(decision)
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, decision: Dict[str, Any]) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, dict(decision), expires_at)
+        if self._writer is not None:
+            self._pending.put((key, json.dumps(decision), expires_at))
+
+    def _write_behind(self) -> None:
+        """Write queued entries, everything that queued up meanwhile in one commit."""
+        while True:
+            batch = [self._pending.get()]
+            while not self._pending.empty():
+                batch.append(self._pending.get_nowait())
+            stop = None in batch
+            rows = [row for row in batch if row is not None]
+            try:
+                with self._disk_lock:
+                    if rows:
+                        self._disk.executemany(
+                            "INSERT OR REPLACE INTO decision_cache (key, decision, expires_at) VALUES (?, ?, ?)",
+                            rows,
+                        )
+                        self._disk.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️  Failed to persist {len(rows)} cached decisions: {e}")
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+            if stop:
+                return
+
+    def close(self) -> None:
+        """Write pending entries and stop the writer thread."""
+        if self._writer is not None:
+            self._pending.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _store(self, key: str, decision: Dict[str, Any], expires_at: float) -> None:
+        self._entries[key] = (expires_at, decision)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+        if self._disk is not None:
+            if self._writer is not None:
+                self._pending.join()  # Pending writes must not resurrect cleared entries
+            with self._disk_lock:
+                removed = max(removed, self._disk.execute("DELETE FROM decision_cache").rowcount)
+                self._disk.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "persistent": self._disk is not None,
+            "hits": self.hits,
+            "preloaded": self.preloaded,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key onto one in-flight task.
+
+    The first caller (the leader) starts the work; callers arriving while it is
+    still running await the same task. The work runs as its own task, so a
+    cancelled caller does not cancel it for everyone else.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(work())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory LRU cache whose entries expire individually.
+
+    ``max_entries=0`` disables storage while still counting lookups.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        """Store ``value`` until ``expires_at`` (Unix time), capped at the default TTL."""
+        deadline = time.time() + self.ttl_seconds
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        with self._lock:
+            self._entries[key] = (deadline, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches ``predicate``; returns how many were removed."""
+        with self._lock:
+            doomed = [key for key in self._entries if predicate(key)]
+            for key in doomed:
+                del self._entries[key]
+            self.invalidations += len(doomed)
+            return len(doomed)
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.max_entries > 0,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def build_decision_cache() -> DecisionCache:
+    """Create the decision cache configured in settings."""
+    if not settings.decision_cache_enabled:
+        return NullDecisionCache()
+    return MemoryDecisionCache(
+        max_entries=settings.decision_cache_max_entries,
+        ttl_seconds=settings.decision_cache_ttl_seconds,
+        path=settings.decision_cache_path,
+    )
@@ -27,15 +27,111 @@ class Settings(BaseSettings):
     cors_origins: str = ""  # Comma-separated list of origins, or "*" for all
     
     # AI/LLM Configuration
+    llm_provider: str = "openai"  # openai (any OpenAI-compatible API at groq_base_url) or fake (local stand-in, no API key)
+    llm_fallback_models: str = ""  # Comma-separated models tried in order when groq_model fails
+    llm_fake_latency_seconds: float = 0.2  # Response time of the fake provider
     groq_api_key: str = ""  # Groq API key for LLM integration
     groq_model: str = "llama-3.1-8b-instant"  # Groq model to use
+    groq_base_url: str = "https://api.groq.com/openai/v1"  # Point at a local stand-in for load tests
     confidence_threshold: float = 0.75  # Minimum confidence to provide AI answer
+
+    # Groq HTTP client pool (one long-lived client per process)
+    groq_http2: bool = False  # Requires the optional 'h2' package
+    groq_max_connections: int = 100
+    groq_max_keepalive_connections: int = 20
+    groq_keepalive_expiry: float = 30.0  # Seconds an idle connection is kept open
+    groq_connect_timeout: float = 5.0
+    groq_read_timeout: float = 30.0
+    groq_write_timeout: float = 10.0
+    groq_pool_timeout: float = 5.0  # Max wait for a free connection from the pool
+
+    # Groq resilience: retries, circuit breaker and hedged requests
+    groq_max_retries: int = 2  # Extra attempts after a 429, 5xx, timeout or dropped connection
+    groq_retry_base_seconds: float = 0.5  # Full-jitter backoff ceiling, doubled per retry
+    groq_retry_max_seconds: float = 8.0  # Give up instead of waiting longer (including Retry-After)
+    groq_breaker_failures: int = 5  # Consecutive retryable failures that open the circuit
+    groq_breaker_reset_seconds: float = 30.0  # Fail fast this long before letting a trial request through
+    groq_hedge_enabled: bool = False  # Send a second request when the first is slower than usual
+    groq_hedge_percentile: float = 95.0  # Latency percentile after which the hedge is sent
+    groq_hedge_min_samples: int = 20  # Successful calls observed before hedging starts
+
+    # Decision cache (exact-match on normalized message + model + prompt version)
+    decision_cache_enabled: bool = True
+    decision_cache_max_entries: int = 2048  # LRU capacity
+    decision_cache_ttl_seconds: int = 3600  # Entry lifetime
+    decision_cache_path: str = ""  # Optional SQLite file for on-disk persistence
+
+    # Answers from resolved (closed) tickets before asking the LLM
+    retrieval_enabled: bool = True
+    retrieval_index_path: str = ""  # Optional directory for the memory-mapped index; empty rebuilds it at startup
+    retrieval_save_delay_seconds: float = 5.0  # Coalesce index saves after ticket changes (0 = save immediately)
+    retrieval_min_similarity: float = 0.65  # Cosine similarity needed to reuse a ticket's resolution
+    retrieval_context_k: int = 0  # Similar resolved tickets passed to the LLM as context (0 = off)
+    retrieval_context_min_similarity: float = 0.1  # Floor for tickets included as context
+
+    # Admission control for LLM-backed endpoints (per process)
+    admission_enabled: bool = True
+    llm_max_concurrency: int = 16  # Upstream LLM calls in flight at once
+    llm_max_queue: int = 64  # Calls allowed to wait for a slot before 503
+    llm_queue_timeout_seconds: float = 10.0  # Longest wait for a slot before 503
+    rate_limit_user_per_minute: float = 60.0  # Token refill per authenticated user
+    rate_limit_user_burst: int = 20
+    rate_limit_ip_per_minute: float = 20.0  # Token refill per client IP for anonymous callers
+    rate_limit_ip_burst: int = 10
+    rate_limit_max_keys: int = 100000  # Buckets kept in memory (least recently seen dropped first)
+
+    # Prometheus metrics at /metrics
+    metrics_enabled: bool = True
+    metrics_token: str = ""  # When set, scrapes must send "Authorization: Bearer <token>"
+
+    # Per-request SQL instrumentation
+    sql_instrumentation_enabled: bool = True
+    server_timing_enabled: bool = True  # Server-Timing: db;dur=<ms>;desc="<n> queries" on responses
+    slow_query_ms: float = 200.0  # Log statements at least this slow, parameters redacted (0 = off)
+    query_count_warn_threshold: int = 20  # In debug mode, warn when one request issues more statements
+
+    # Background jobs (persistent queue in the jobs table, run by an in-process worker)
+    jobs_worker_enabled: bool = True  # False leaves jobs to another process or `python -m app.manage run-jobs`
+    jobs_poll_interval: float = 1.0  # Seconds between polls when no commit has woken the worker
+    jobs_batch_size: int = 20  # Jobs claimed per poll
+    jobs_max_attempts: int = 5  # Failures before a job is dead-lettered
+    jobs_retry_base_seconds: float = 2.0  # Backoff doubles per attempt (capped at 5 minutes)
+    jobs_lock_timeout_seconds: float = 300.0  # A job running longer is assumed crashed and retried
+
+    # Batch assist (POST /webhook/assist-or-ticket/batch)
+    assist_batch_max_messages: int = 500  # Messages accepted per request
+    assist_batch_concurrency: int = 8  # AI decisions in flight per request
+    assist_batch_write_size: int = 50  # Max finished items persisted per transaction
+
+    # Bulk ticket API (POST /tickets/bulk)
+    tickets_bulk_max_items: int = 1000  # Creates + updates + deletes allowed per request
+    tickets_bulk_mode: str = "atomic"  # "atomic" rolls back on any failure; "partial" applies the valid items
+
+    # Near-duplicate ticket detection (MinHash + LSH over title and description)
+    dedup_mode: str = "attach"  # "attach" escalations to an open duplicate, "flag" new duplicates, or "off"
+    dedup_threshold: float = 0.5  # Estimated Jaccard similarity of character shingles to count as duplicate
+
+    # Local pre-router in front of the LLM (keyword rules + hashed n-gram model)
+    router_enabled: bool = True
+    router_model_path: str = ""  # .npz from `python -m app.manage train-router`; empty = keyword rules only
+    router_rules_path: str = ""  # Optional JSON list of extra {pattern, action, short_title, reply_text} rules
+    router_escalate_threshold: float = 0.9  # Model P(escalate) needed to skip the LLM
     
     # Authentication Configuration
     secret_key: str = "your-secret-key-change-this-in-production"  # JWT secret key
     algorithm: str = "HS256"  # JWT algorithm
     access_token_expire_hours: int = 24  # Token expiration in hours
 
+    # Password hashing (bcrypt runs on its own bounded thread pool)
+    bcrypt_rounds: int = 12  # Cost factor; hashes with another cost are rehashed on next login
+    password_hash_workers: int = 4  # Threads dedicated to bcrypt
+    password_hash_max_queue: int = 64  # Jobs allowed to wait for a thread before answering 429
+
+    # Authenticated principal cache (per process; ORM updates/deletes of a user invalidate it)
+    auth_cache_enabled: bool = True
+    auth_cache_max_entries: int = 10000  # LRU capacity for principals and for decoded tokens
+    auth_cache_ttl_seconds: int = 60  # Upper bound on staleness for changes made outside this process
+
 
     model_config = SettingsConfigDict(
         env_file=".env",
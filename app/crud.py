@@ -1,21 +1,46 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func, desc
-from . import models, schemas
-from typing import Optional, List
+from sqlalchemy import and_, or_, func, desc, select, case, update, delete, insert, bindparam
+from sqlalchemy.exc import SQLAlchemyError
+from . import dedup, jobs, models, schemas, search
+from .pagination import keyset_page
+from collections import defaultdict
+from datetime import timedelta
+from typing import Optional, List, Tuple
 
 # ---------- Ticket CRUD ----------
 
-def create_ticket(db: Session, ticket_in: schemas.TicketCreate, user_id: int = None) -> models.Ticket:
+def create_ticket(
+    db: Session,
+    ticket_in: schemas.TicketCreate,
+    user_id: int = None,
+    duplicate_of_id: Optional[int] = None,
+) -> models.Ticket:
     ticket_data = ticket_in.dict()
     if user_id:
         ticket_data["user_id"] = user_id
-    ticket = models.Ticket(**ticket_data)
+    ticket = models.Ticket(**ticket_data, duplicate_of_id=duplicate_of_id)
     db.add(ticket)
     db.commit()
     db.refresh(ticket)
     return ticket
 
-def get_tickets(db: Session, skip: int = 0, limit: int = 100, q: str | None = None, status: str | None = None):
+def get_tickets(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    q: str | None = None,
+    status: str | None = None,
+    mode: str = "fulltext",
+    highlight: bool = False,
+):
+    """
+    List tickets, newest first. With ``q``, "fulltext" mode ranks matches by
+    relevance using the full-text index (when installed); "substring" mode
+    keeps the plain ILIKE filter.
+    """
+    if q and mode == "fulltext" and search.is_available():
+        return search.search_tickets(db, q, skip=skip, limit=limit, status=status, highlight=highlight)
+
     query = db.query(models.Ticket)
     if q:
         like = f"%{q}%"
@@ -24,6 +49,37 @@ def get_tickets(db: Session, skip: int = 0, limit: int = 100, q: str | None = No
         query = query.filter(models.Ticket.status == status)
     return query.order_by(models.Ticket.created_at.desc()).offset(skip).limit(limit).all()
 
+def get_tickets_page(
+    db: Session,
+    limit: int = 100,
+    cursor: str | None = None,
+    q: str | None = None,
+    status: str | None = None,
+    mode: str = "fulltext",
+    highlight: bool = False,
+):
+    """
+    Keyset-paginated tickets ordered by (created_at, id) desc.
+    With ``q`` results are filtered, not ranked, so the order stays stable across pages;
+    ``highlight`` adds snippets to full-text matches as in get_tickets.
+    """
+    fulltext = bool(q) and mode == "fulltext" and search.is_available()
+    query = db.query(models.Ticket)
+    if q:
+        if fulltext:
+            query = query.filter(models.Ticket.id.in_(search.matching_ticket_ids(db, q)))
+        else:
+            like = f"%{q}%"
+            query = query.filter(or_(models.Ticket.title.ilike(like), models.Ticket.description.ilike(like)))
+    if status:
+        query = query.filter(models.Ticket.status == status)
+    tickets, next_cursor = keyset_page(db, query, models.Ticket.created_at, models.Ticket.id, limit, cursor)
+    if highlight and fulltext:
+        found = search.snippets(db, q, [ticket.id for ticket in tickets])
+        for ticket in tickets:
+            ticket.snippet = found.get(ticket.id)
+    return tickets, next_cursor
+
 def get_ticket(db: Session, ticket_id: int):
     return db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
 
@@ -41,10 +97,143 @@ def delete_ticket(db: Session, ticket_id: int) -> bool:
     ticket = get_ticket(db, ticket_id)
     if not ticket:
         return False
+    _detach_duplicates(db, [ticket_id])
     db.delete(ticket)
     db.commit()
     return True
 
+def _detach_duplicates(db: Session, ticket_ids: List[int]) -> None:
+    """Clear ``duplicate_of_id`` on tickets pointing at tickets about to be deleted."""
+    table = models.Ticket.__table__
+    db.execute(
+        update(table)
+        .where(table.c.duplicate_of_id.in_(ticket_ids))
+        .values(duplicate_of_id=None, updated_at=table.c.updated_at)
+    )
+
+def _insert_tickets(db: Session, creates: List[schemas.TicketCreate], results: List[dict]) -> None:
+    rows = []
+    for ticket_in in creates:
+        row = ticket_in.dict()
+        row["duplicate_of_id"] = dedup.find_duplicate(row["title"], row["description"])
+        rows.append(row)
+    ids = db.scalars(
+        insert(models.Ticket).returning(models.Ticket.id, sort_by_parameter_order=True), rows
+    ).all()
+    for result, ticket_id in zip(results, ids):
+        result["id"] = ticket_id
+
+def _update_tickets(db: Session, updates: List[schemas.TicketBulkUpdate]) -> None:
+    """
+    Updates setting identical values share one ``UPDATE ... WHERE id IN``; the
+    rest go out as one executemany per set of changed columns.
+    """
+    table = models.Ticket.__table__
+    groups = defaultdict(list)  # sorted (column, value) pairs -> ticket ids
+    for ticket_in in updates:
+        values = ticket_in.dict(exclude_unset=True, exclude={"id"})
+        if values:
+            groups[tuple(sorted(values.items()))].append(ticket_in.id)
+
+    singles = defaultdict(list)  # column names -> executemany parameter rows
+    for items, ids in groups.items():
+        if len(ids) > 1:
+            db.execute(update(table).where(table.c.id.in_(ids)).values(dict(items)))
+        else:
+            singles[tuple(column for column, _ in items)].append(
+                {"ticket_id": ids[0], **{f"new_{column}": value for column, value in items}}
+            )
+    for columns, rows in singles.items():
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("ticket_id"))
+            .values({column: bindparam(f"new_{column}") for column in columns}),
+            rows,
+        )
+
+def _delete_tickets(db: Session, ticket_ids: List[int]) -> None:
+    if ticket_ids:
+        _detach_duplicates(db, ticket_ids)
+        db.execute(delete(models.Ticket).where(models.Ticket.id.in_(ticket_ids)))
+
+def _fail(results: List[dict], error: str) -> None:
+    for result in results:
+        if result["ok"]:
+            result.update(ok=False, error=error)
+
+def bulk_tickets(
+    db: Session,
+    creates: List[schemas.TicketCreate],
+    updates: List[schemas.TicketBulkUpdate],
+    deletes: List[int],
+    atomic: bool = True,
+) -> List[dict]:
+    """
+    Apply ticket creates, updates and deletes in one transaction and return one
+    result per item: creates first, then updates, then deletes, each in request
+    order. Successful creates and updates carry the resulting ``ticket``.
+
+    Each kind runs as batched statements rather than a round trip per ticket.
+    Items naming a missing ticket, or a ticket already named earlier in the
+    request, fail. With ``atomic`` any failure leaves the database untouched;
+    otherwise valid items are applied and creates, updates and deletes each
+    succeed or fail as a group.
+    """
+    Ticket = models.Ticket
+    create_results = [{"op": "create", "index": i, "id": None, "ok": True, "error": None} for i in range(len(creates))]
+    update_results = [{"op": "update", "index": i, "id": u.id, "ok": True, "error": None} for i, u in enumerate(updates)]
+    delete_results = [{"op": "delete", "index": i, "id": t, "ok": True, "error": None} for i, t in enumerate(deletes)]
+    results = create_results + update_results + delete_results
+
+    referenced = {u.id for u in updates} | set(deletes)
+    existing = set(db.scalars(select(Ticket.id).where(Ticket.id.in_(referenced)))) if referenced else set()
+    seen = set()
+    for result in update_results + delete_results:
+        if result["id"] not in existing:
+            result.update(ok=False, error="Ticket not found")
+        elif result["id"] in seen:
+            result.update(ok=False, error="Ticket appears more than once in this request")
+        seen.add(result["id"])
+    if atomic and not all(r["ok"] for r in results):
+        _fail(results, "Not applied: another item in this request failed")
+        return results
+
+    phases = [
+        (create_results, lambda: _insert_tickets(db, creates, create_results)),
+        (update_results, lambda: _update_tickets(db, [u for u, r in zip(updates, update_results) if r["ok"]])),
+        (delete_results, lambda: _delete_tickets(db, [r["id"] for r in delete_results if r["ok"]])),
+    ]
+    for phase_results, apply in phases:
+        if not any(r["ok"] for r in phase_results):
+            continue
+        try:
+            if atomic:
+                apply()
+            else:
+                with db.begin_nested():
+                    apply()
+        except SQLAlchemyError as e:
+            error = f"Database error: {getattr(e, 'orig', None) or e}"
+            if atomic:
+                db.rollback()
+                _fail(results, error)
+                return results
+            _fail(phase_results, error)
+    db.commit()
+
+    changed = [r["id"] for r in create_results + update_results if r["ok"]]
+    if changed:
+        tickets = {
+            t.id: t
+            for t in db.scalars(
+                select(Ticket).where(Ticket.id.in_(changed)).execution_options(populate_existing=True)
+            )
+        }
+        for result in create_results + update_results:
+            if result["ok"]:
+                result["ticket"] = tickets.get(result["id"])
+    return results
+
 # ---------- Conversation CRUD ----------
 
 def create_conversation(db: Session, conversation_in: schemas.ConversationCreate, user_id: Optional[int] = None) -> models.Conversation:
@@ -77,6 +266,24 @@ def get_conversations(
     
     return query.order_by(desc(models.Conversation.updated_at)).offset(skip).limit(limit).all()
 
+def get_conversations_page(
+    db: Session,
+    user_id: Optional[int] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    status: Optional[models.ConversationStatus] = None
+):
+    """Keyset-paginated conversations ordered by (updated_at, id) desc."""
+    query = db.query(models.Conversation)
+    
+    if user_id is not None:
+        query = query.filter(models.Conversation.user_id == user_id)
+    
+    if status:
+        query = query.filter(models.Conversation.status == status)
+    
+    return keyset_page(db, query, models.Conversation.updated_at, models.Conversation.id, limit, cursor)
+
 def get_conversation(db: Session, conversation_id: int, user_id: Optional[int] = None) -> Optional[models.Conversation]:
     """Get a specific conversation."""
     query = db.query(models.Conversation).filter(models.Conversation.id == conversation_id)
@@ -150,10 +357,12 @@ def create_message(
     
     db.add(message)
     
-    # Update conversation's updated_at timestamp
+    # Update conversation's updated_at timestamp and latest exchange summary
     conversation = db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
     if conversation:
         conversation.updated_at = func.now()
+        for column, value in summary_update_values(role, content).items():
+            setattr(conversation, column, value)
     
     db.commit()
     db.refresh(message)
@@ -173,6 +382,23 @@ def get_messages(
             .limit(limit)
             .all())
 
+def get_messages_page(
+    db: Session,
+    conversation_id: int,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    newest_first: bool = False
+):
+    """
+    Keyset-paginated messages of a conversation ordered by (created_at, id).
+    ``newest_first`` walks backwards from the tail, so a long thread can show
+    its latest messages without loading the rest.
+    """
+    query = db.query(models.Message).filter(models.Message.conversation_id == conversation_id)
+    return keyset_page(
+        db, query, models.Message.created_at, models.Message.id, limit, cursor, descending=newest_first
+    )
+
 def get_message(db: Session, message_id: int) -> Optional[models.Message]:
     """Get a specific message."""
     return db.query(models.Message).filter(models.Message.id == message_id).first()
@@ -184,9 +410,302 @@ def delete_message(db: Session, message_id: int) -> bool:
         return False
     
     db.delete(message)
+    db.flush()
+    refresh_conversation_summaries(db, [message.conversation_id])
     db.commit()
     return True
 
+# ---------- Assist unit of work ----------
+
+def escalation_notice(ticket: models.Ticket) -> str:
+    """Assistant reply recorded when a question is escalated to a ticket."""
+    return f"Ticket #{ticket.id} created (status: {ticket.status}). Our team will follow up."
+
+def duplicate_notice(ticket: models.Ticket) -> str:
+    """Assistant reply recorded when a question is attached to an existing ticket."""
+    return (f"This looks like ticket #{ticket.id} (status: {ticket.status}), which is already open; "
+            "your report was added to it. Our team will follow up.")
+
+def build_assist_exchange(
+    question: str,
+    user_id: Optional[int] = None,
+    ticket_in: Optional[schemas.TicketCreate] = None,
+    duplicate_of_id: Optional[int] = None,
+) -> Tuple[models.Conversation, Optional[models.Ticket]]:
+    """
+    Build (but do not add) a titled conversation holding the user's question,
+    plus the escalation ticket linked to it when ``ticket_in`` is given
+    (flagged as a duplicate of ``duplicate_of_id`` if set).
+    """
+    conversation = models.Conversation(
+        title=title_from_message(question),
+        user_id=user_id or None,
+        last_question=question,
+        last_question_at=func.now(),
+    )
+    conversation.messages.append(models.Message(content=question, role=models.MessageRole.USER))
+
+    ticket = None
+    if ticket_in is not None:
+        ticket = models.Ticket(
+            **ticket_in.dict(),
+            user_id=user_id or None,
+            conversation=conversation,
+            duplicate_of_id=duplicate_of_id,
+        )
+    return conversation, ticket
+
+def create_assist_exchange(
+    db: Session,
+    question: str,
+    ai_action: str,
+    ai_confidence: Optional[int] = None,
+    reply_text: str = "",
+    user_id: Optional[int] = None,
+    ticket_in: Optional[schemas.TicketCreate] = None,
+    duplicate_of_id: Optional[int] = None,
+) -> Tuple[models.Conversation, models.Message, Optional[models.Ticket]]:
+    """
+    Persist one assistant round trip in a single transaction.
+
+    Creates the conversation (already titled), the user message and either the
+    assistant reply or, when ``ticket_in`` is given, the escalation ticket
+    linked via ``Ticket.conversation_id``. The ticket's escalation notice is
+    not needed for the response, so it is queued as a background job in the
+    same transaction and the returned reply is None.
+    """
+    conversation, ticket = build_assist_exchange(question, user_id, ticket_in, duplicate_of_id)
+    db.add(conversation)
+    if ticket is not None:
+        db.add(ticket)
+        db.flush()  # Assigns ids for the deferred notice
+        defer_reply(db, conversation.id, escalation_notice(ticket), ai_confidence, ai_action)
+        db.commit()
+        return conversation, None, ticket
+
+    reply = models.Message(
+        content=reply_text,
+        role=models.MessageRole.ASSISTANT,
+        ai_confidence=ai_confidence,
+        ai_action=ai_action,
+    )
+    conversation.messages.append(reply)
+    conversation.last_answer = reply_text
+    conversation.last_answer_at = func.now()
+    db.commit()
+    return conversation, reply, ticket
+
+def attach_assist_exchange(
+    db: Session,
+    question: str,
+    ticket_id: int,
+    ai_action: str = "escalate",
+    ai_confidence: Optional[int] = None,
+    user_id: Optional[int] = None,
+) -> Optional[Tuple[models.Conversation, models.Message, models.Ticket]]:
+    """
+    Record an escalated question against an existing open ticket instead of
+    opening a new one. The conversation is stored now; its notice pointing at
+    the ticket and the ticket's ``duplicate_count`` bump are queued as
+    background jobs in the same transaction (the returned reply is None).
+
+    Returns None (and writes nothing) if the ticket is gone or no longer open.
+    """
+    ticket = db.get(models.Ticket, ticket_id)
+    if ticket is None or ticket.status not in dedup.OPEN_STATUSES:
+        return None
+    conversation, _ = build_assist_exchange(question, user_id)
+    db.add(conversation)
+    db.flush()  # Assigns conversation.id for the deferred notice
+    defer_reply(db, conversation.id, duplicate_notice(ticket), ai_confidence, ai_action)
+    jobs.enqueue(db, "ticket_duplicates", {"ticket_id": ticket.id, "count": 1})
+    db.commit()
+    return conversation, None, ticket
+
+def attach_targets(exchanges: List[dict]):
+    """SELECT of the still-open tickets that ``exchanges`` want to attach to, or None."""
+    ids = {e["attach_to"] for e in exchanges if e.get("attach_to")}
+    if not ids:
+        return None
+    return select(models.Ticket).where(
+        models.Ticket.id.in_(ids), models.Ticket.status.in_(dedup.OPEN_STATUSES)
+    )
+
+def _insert_returning(db: Session, entity, rows: List[dict], chunk: int = 500) -> list:
+    """
+    Insert ``rows`` with multi-row INSERT ... RETURNING statements and return
+    the new objects in ``rows`` order. Ids within one statement increase in
+    VALUES order on SQLite and Postgres, so sorting by id restores it (an
+    executemany with sort_by_parameter_order would go row by row on SQLite).
+    """
+    created = []
+    for start in range(0, len(rows), chunk):
+        created.extend(db.scalars(insert(entity).values(rows[start:start + chunk]).returning(entity)))
+    return sorted(created, key=lambda obj: obj.id)
+
+def insert_assist_exchanges(db: Session, exchanges: List[dict], open_tickets: dict) -> List[tuple]:
+    """
+    Write the conversations, messages and tickets for ``exchanges`` with one
+    multi-row INSERT per table, and queue the escalation notices and duplicate
+    counts as background jobs. An exchange whose ``attach_to`` ticket is not in
+    ``open_tickets`` gets its own ticket instead. Does not commit.
+
+    Returns (conversation, reply, ticket, attached) per exchange; reply is None
+    when it was deferred.
+    """
+    targets = [open_tickets.get(exchange.get("attach_to")) for exchange in exchanges]
+    answered = [
+        target is None and exchange.get("ticket_in") is None
+        for exchange, target in zip(exchanges, targets)
+    ]
+
+    conversations = _insert_returning(db, models.Conversation, [
+        {
+            "title": title_from_message(exchange["question"]),
+            "user_id": exchange.get("user_id") or None,
+            "last_question": exchange["question"],
+            "last_question_at": func.now(),
+            "last_answer": exchange.get("reply_text", "") if answer else None,
+            "last_answer_at": func.now() if answer else None,
+        }
+        for exchange, answer in zip(exchanges, answered)
+    ])
+
+    message_rows = []
+    for exchange, conversation, answer in zip(exchanges, conversations, answered):
+        message_rows.append({
+            "conversation_id": conversation.id,
+            "content": exchange["question"],
+            "role": models.MessageRole.USER,
+            "ai_confidence": None,
+            "ai_action": None,
+        })
+        if answer:
+            message_rows.append({
+                "conversation_id": conversation.id,
+                "content": exchange.get("reply_text", ""),
+                "role": models.MessageRole.ASSISTANT,
+                "ai_confidence": exchange.get("ai_confidence"),
+                "ai_action": exchange["ai_action"],
+            })
+    replies = iter(m for m in _insert_returning(db, models.Message, message_rows)
+                   if m.role == models.MessageRole.ASSISTANT)
+
+    escalated = [
+        (exchange, conversation)
+        for exchange, conversation, target, answer in zip(exchanges, conversations, targets, answered)
+        if target is None and not answer
+    ]
+    tickets = _insert_returning(db, models.Ticket, [
+        {
+            **exchange["ticket_in"].dict(),
+            "user_id": exchange.get("user_id") or None,
+            "conversation_id": conversation.id,
+            "duplicate_of_id": exchange.get("duplicate_of_id"),
+        }
+        for exchange, conversation in escalated
+    ]) if escalated else []
+    new_tickets = iter(tickets)
+
+    results, notices = [], []
+    attached = defaultdict(int)
+    for exchange, conversation, target, answer in zip(exchanges, conversations, targets, answered):
+        if answer:
+            results.append((conversation, next(replies), None, False))
+            continue
+        if target is not None:
+            attached[target.id] += 1
+            ticket, notice = target, duplicate_notice(target)
+        else:
+            ticket = next(new_tickets)
+            notice = escalation_notice(ticket)
+        notices.append(reply_job(conversation.id, notice, exchange.get("ai_confidence"), exchange["ai_action"]))
+        results.append((conversation, None, ticket, target is not None))
+
+    jobs.enqueue_many(db, "assistant_reply", notices)
+    jobs.enqueue_many(db, "ticket_duplicates", [
+        {"ticket_id": ticket_id, "count": count} for ticket_id, count in attached.items()
+    ])
+    return results
+
+def create_assist_exchanges(db: Session, exchanges: List[dict]) -> List[tuple]:
+    """
+    Persist many assistant round trips with one multi-row INSERT per table and
+    one commit (escalation notices and duplicate counts are queued as
+    background jobs).
+
+    Each exchange is a dict of create_assist_exchange's keyword arguments
+    (``question``, ``ai_action``, ``ai_confidence``, ``reply_text``,
+    ``user_id``, ``ticket_in``, ``duplicate_of_id``) plus an optional
+    ``attach_to`` ticket id, handled as in attach_assist_exchange. Returns
+    (conversation, reply, ticket, attached) per exchange, in order.
+    """
+    stmt = attach_targets(exchanges)
+    open_tickets = {t.id: t for t in db.scalars(stmt)} if stmt is not None else {}
+    results = insert_assist_exchanges(db, exchanges, open_tickets)
+    db.commit()
+    return results
+
+# ---------- Background jobs ----------
+
+def defer_reply(
+    db,
+    conversation_id: int,
+    content: str,
+    ai_confidence: Optional[int] = None,
+    ai_action: Optional[str] = None,
+) -> None:
+    """Queue an assistant message for the background worker, in the caller's transaction."""
+    jobs.enqueue(db, "assistant_reply", reply_job(conversation_id, content, ai_confidence, ai_action))
+
+def reply_job(
+    conversation_id: int,
+    content: str,
+    ai_confidence: Optional[int] = None,
+    ai_action: Optional[str] = None,
+) -> dict:
+    """Payload of an ``assistant_reply`` job."""
+    return {
+        "conversation_id": conversation_id,
+        "content": content,
+        "ai_confidence": ai_confidence,
+        "ai_action": ai_action,
+    }
+
+@jobs.handler("assistant_reply")
+def _assistant_reply_job(db: Session, payload: dict) -> None:
+    Conversation = models.Conversation
+    conversation_id = payload["conversation_id"]
+    if db.get(Conversation, conversation_id) is None:
+        return  # Deleted before the job ran
+    role = models.MessageRole.ASSISTANT
+    db.add(models.Message(
+        conversation_id=conversation_id,
+        content=payload["content"],
+        role=role,
+        ai_confidence=payload.get("ai_confidence"),
+        ai_action=payload.get("ai_action"),
+    ))
+    db.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(updated_at=func.now(), **summary_update_values(role, payload["content"]))
+    )
+
+@jobs.handler("conversation_title")
+def _conversation_title_job(db: Session, payload: dict) -> None:
+    conversation = db.get(models.Conversation, payload["conversation_id"])
+    if conversation is not None and not conversation.title:
+        conversation.title = generate_conversation_title(db, conversation.id)
+
+@jobs.handler("ticket_duplicates")
+def _ticket_duplicates_job(db: Session, payload: dict) -> None:
+    db.execute(
+        update(models.Ticket)
+        .where(models.Ticket.id == payload["ticket_id"])
+        .values(duplicate_count=models.Ticket.duplicate_count + payload["count"])
+    )
+
 # ---------- Helper Functions ----------
 
 def generate_conversation_title(db: Session, conversation_id: int) -> str:
@@ -198,14 +717,17 @@ def generate_conversation_title(db: Session, conversation_id: int) -> str:
                     .first())
     
     if first_message:
-        # Take first 50 characters and add ellipsis if longer
-        content = first_message.content.strip()
-        if len(content) > 50:
-            return content[:50] + "..."
-        return content
+        return title_from_message(first_message.content)
     
     return "New Conversation"
 
+def title_from_message(content: str) -> str:
+    """Build a conversation title from a message: first 50 characters, with ellipsis if longer."""
+    content = content.strip()
+    if len(content) > 50:
+        return content[:50] + "..."
+    return content
+
 def update_conversation_title(db: Session, conversation_id: int) -> Optional[models.Conversation]:
     """Auto-generate and update conversation title if not set."""
     conversation = db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
@@ -229,44 +751,235 @@ def get_user_query_history(
     - question: latest USER message in the conversation
     - answer: the ASSISTANT message immediately following the latest USER message (if any)
     Ordered by conversation.updated_at desc.
+
+    Reads the summary columns kept on each conversation, so this is a single
+    range scan of ix_conversations_user_id_updated_at.
     """
-    # First fetch conversations for this user
-    query = db.query(models.Conversation)
+    Conversation = models.Conversation
+    query = db.query(
+        Conversation.id,
+        Conversation.last_question,
+        Conversation.last_answer,
+        Conversation.created_at,
+        Conversation.updated_at,
+    ).filter(Conversation.last_question.isnot(None))
     if user_id is not None:
-        query = query.filter(models.Conversation.user_id == user_id)
-    conversations = query.order_by(desc(models.Conversation.updated_at)).limit(limit).all()
-
-    items: List[schemas.QueryHistoryItem] = []
-    for conv in conversations:
-        # Latest USER message
-        latest_user_msg = (
-            db.query(models.Message)
-            .filter(models.Message.conversation_id == conv.id,
-                    models.Message.role == models.MessageRole.USER)
-            .order_by(models.Message.created_at.desc())
-            .first()
+        query = query.filter(Conversation.user_id == user_id)
+    rows = query.order_by(desc(Conversation.updated_at), desc(Conversation.id)).limit(limit).all()
+
+    return [
+        schemas.QueryHistoryItem(
+            conversation_id=row.id,
+            question=row.last_question,
+            answer=row.last_answer,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
         )
-        if not latest_user_msg:
-            continue
+        for row in rows
+    ]
 
-        # Find the first ASSISTANT message after that user message
-        latest_assistant_msg = (
-            db.query(models.Message)
-            .filter(models.Message.conversation_id == conv.id,
-                    models.Message.role == models.MessageRole.ASSISTANT,
-                    models.Message.created_at >= latest_user_msg.created_at)
-            .order_by(models.Message.created_at.asc())
-            .first()
+def routing_examples(db: Session) -> List[Tuple[str, str]]:
+    """
+    (question, ai_action) pairs from stored conversations: each assistant
+    message labelled answer/escalate, paired with the user message before it.
+    """
+    Message = models.Message
+    rows = db.execute(
+        select(Message.conversation_id, Message.role, Message.content, Message.ai_action)
+        .order_by(Message.conversation_id, Message.created_at, Message.id)
+        .execution_options(yield_per=1000)
+    )
+    examples = []
+    current, question = None, None
+    for conversation_id, role, content, ai_action in rows:
+        if conversation_id != current:
+            current, question = conversation_id, None
+        if role == models.MessageRole.USER:
+            question = content
+        elif role == models.MessageRole.ASSISTANT and question and ai_action in ("answer", "escalate"):
+            examples.append((question, ai_action))
+            question = None
+    return examples
+
+# ---------- Conversation summaries ----------
+
+# Summary timestamps come from the statement that wrote them, which on SQLite
+# can trail the message's own created_at by a clock tick
+SUMMARY_CLOCK_SKEW = timedelta(seconds=1)
+
+def summary_update_values(role: models.MessageRole, content: str) -> dict:
+    """
+    Conversation column values that fold a new message into its summary.
+
+    Usable both as ORM attribute assignments and in ``update(...).values()``.
+    A USER message starts a new exchange; an ASSISTANT message only fills the
+    answer if the latest question has none yet (decided in SQL, so concurrent
+    writers cannot overwrite the first reply).
+    """
+    if role == models.MessageRole.USER:
+        return {
+            "last_question": content,
+            "last_question_at": func.now(),
+            "last_answer": None,
+            "last_answer_at": None,
+        }
+    if role == models.MessageRole.ASSISTANT:
+        Conversation = models.Conversation
+        awaiting = and_(Conversation.last_question.isnot(None), Conversation.last_answer.is_(None))
+        return {
+            "last_answer": case((awaiting, content), else_=Conversation.last_answer),
+            "last_answer_at": case((awaiting, func.now()), else_=Conversation.last_answer_at),
+        }
+    return {}
+
+def latest_exchanges(conversation_ids):
+    """
+    Select the latest exchange of each conversation, computed from ``messages``.
+
+    ``conversation_ids`` is a list or a selectable of ids. Rows have
+    conversation_id, question, question_at, answer and answer_at; conversations
+    without a USER message are absent. Window functions pick the latest user
+    message and the first assistant reply after it.
+    """
+    Message = models.Message
+
+    # Latest USER message per conversation
+    ranked_questions = (
+        select(
+            Message.id,
+            Message.conversation_id,
+            Message.content,
+            Message.created_at,
+            func.row_number().over(
+                partition_by=Message.conversation_id,
+                order_by=(Message.created_at.desc(), Message.id.desc()),
+            ).label("rn"),
         )
+        .where(Message.role == models.MessageRole.USER,
+               Message.conversation_id.in_(conversation_ids))
+        .subquery("ranked_questions")
+    )
+    questions = (
+        select(ranked_questions)
+        .where(ranked_questions.c.rn == 1)
+        .subquery("questions")
+    )
 
-        items.append(
-            schemas.QueryHistoryItem(
-                conversation_id=conv.id,
-                question=latest_user_msg.content,
-                answer=latest_assistant_msg.content if latest_assistant_msg else None,
-                created_at=conv.created_at,
-                updated_at=conv.updated_at,
-            )
+    # First ASSISTANT message after that user message; ids order same-timestamp rows
+    after_question = or_(
+        Message.created_at > questions.c.created_at,
+        and_(Message.created_at == questions.c.created_at, Message.id > questions.c.id),
+    )
+    ranked_answers = (
+        select(
+            Message.conversation_id,
+            Message.content,
+            Message.created_at,
+            func.row_number().over(
+                partition_by=Message.conversation_id,
+                order_by=(Message.created_at.asc(), Message.id.asc()),
+            ).label("rn"),
+        )
+        .join(questions, and_(questions.c.conversation_id == Message.conversation_id, after_question))
+        .where(Message.role == models.MessageRole.ASSISTANT)
+        .subquery("ranked_answers")
+    )
+
+    return (
+        select(
+            questions.c.conversation_id,
+            questions.c.content.label("question"),
+            questions.c.created_at.label("question_at"),
+            ranked_answers.c.content.label("answer"),
+            ranked_answers.c.created_at.label("answer_at"),
         )
+        .outerjoin(ranked_answers, and_(ranked_answers.c.conversation_id == questions.c.conversation_id,
+                                        ranked_answers.c.rn == 1))
+    )
+
+def _summary_rows(db, conversation_ids: List[int]) -> List[dict]:
+    """Recomputed summary for each id (all None when it has no question)."""
+    computed = {row.conversation_id: row for row in db.execute(latest_exchanges(conversation_ids))}
+    rows = []
+    for conversation_id in conversation_ids:
+        row = computed.get(conversation_id)
+        rows.append({
+            "conversation_id": conversation_id,
+            "question": row.question if row else None,
+            "question_at": row.question_at if row else None,
+            "answer": row.answer if row else None,
+            "answer_at": row.answer_at if row else None,
+        })
+    return rows
+
+def refresh_conversation_summaries(db, conversation_ids: List[int]) -> int:
+    """
+    Recompute the summary columns of the given conversations from their messages.
+
+    ``db`` may be a Session or a Connection; the caller commits. Rewrites every
+    row in one executemany and leaves ``updated_at`` untouched.
+    """
+    if not conversation_ids:
+        return 0
+    table = models.Conversation.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("conversation_id"))
+        .values(
+            last_question=bindparam("question"),
+            last_question_at=bindparam("question_at"),
+            last_answer=bindparam("answer"),
+            last_answer_at=bindparam("answer_at"),
+            updated_at=table.c.updated_at,  # Suppress onupdate: history order must not change
+        )
+    )
+    db.execute(stmt, _summary_rows(db, conversation_ids))
+    return len(conversation_ids)
+
+def _conversation_batches(db, batch_size: int):
+    """Yield conversation rows (id plus stored summary) in id order, ``batch_size`` at a time."""
+    Conversation = models.Conversation
+    after = 0
+    while True:
+        batch = db.execute(
+            select(
+                Conversation.id,
+                Conversation.last_question,
+                Conversation.last_question_at,
+                Conversation.last_answer,
+                Conversation.last_answer_at,
+            )
+            .where(Conversation.id > after)
+            .order_by(Conversation.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            return
+        yield batch
+        after = batch[-1].id
+
+def backfill_conversation_summaries(db, batch_size: int = 500) -> int:
+    """Recompute every conversation summary; returns the number of conversations written."""
+    written = 0
+    for batch in _conversation_batches(db, batch_size):
+        written += refresh_conversation_summaries(db, [row.id for row in batch])
+    return written
+
+def _same_time(stored, computed) -> bool:
+    if stored is None or computed is None:
+        return stored is computed
+    return abs(stored - computed) <= SUMMARY_CLOCK_SKEW
 
-    return items
+def check_conversation_summaries(db, batch_size: int = 500) -> List[int]:
+    """Return ids of conversations whose stored summary disagrees with their messages."""
+    mismatched = []
+    for batch in _conversation_batches(db, batch_size):
+        expected = {row["conversation_id"]: row for row in _summary_rows(db, [row.id for row in batch])}
+        for row in batch:
+            want = expected[row.id]
+            if (row.last_question != want["question"]
+                    or row.last_answer != want["answer"]
+                    or not _same_time(row.last_question_at, want["question_at"])
+                    or not _same_time(row.last_answer_at, want["answer_at"])):
+                mismatched.append(row.id)
+    return mismatched
@@ -0,0 +1,225 @@
+"""
+Async counterparts of the CRUD functions used by async routes.
+
+Each function accepts either an AsyncSession or, when no async driver is
+installed, a regular Session; the sync path runs the matching ``crud``
+function in the thread pool so the event loop is never blocked by the DB.
+"""
+
+from typing import List, Optional, Tuple, Union
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from . import crud, dedup, jobs, models, schemas
+from .db import AsyncSessionLocal, SessionLocal
+
+AsyncDB = Union[AsyncSession, Session]
+
+# ---------- Session helpers ----------
+
+def open_session() -> AsyncDB:
+    """Open an AsyncSession, falling back to a sync Session when async is unavailable."""
+    if AsyncSessionLocal is not None:
+        return AsyncSessionLocal()
+    return SessionLocal()
+
+async def close_session(db: AsyncDB) -> None:
+    if isinstance(db, Session):
+        await run_in_threadpool(db.close)
+    else:
+        await db.close()
+
+async def rollback(db: AsyncDB) -> None:
+    if isinstance(db, Session):
+        await run_in_threadpool(db.rollback)
+    else:
+        await db.rollback()
+
+# ---------- Ticket CRUD ----------
+
+async def create_ticket(db: AsyncDB, ticket_in: schemas.TicketCreate, user_id: int = None) -> models.Ticket:
+    if isinstance(db, Session):
+        return await run_in_threadpool(crud.create_ticket, db, ticket_in, user_id)
+
+    ticket_data = ticket_in.dict()
+    if user_id:
+        ticket_data["user_id"] = user_id
+    ticket = models.Ticket(**ticket_data)
+    db.add(ticket)
+    await db.commit()
+    await db.refresh(ticket)
+    return ticket
+
+# ---------- Conversation CRUD ----------
+
+async def create_conversation(db: AsyncDB, conversation_in: schemas.ConversationCreate, user_id: Optional[int] = None) -> models.Conversation:
+    """Create a new conversation."""
+    if isinstance(db, Session):
+        return await run_in_threadpool(crud.create_conversation, db, conversation_in, user_id)
+
+    conversation_data = conversation_in.dict()
+    if user_id:
+        conversation_data["user_id"] = user_id
+
+    conversation = models.Conversation(**conversation_data)
+    db.add(conversation)
+    await db.commit()
+    await db.refresh(conversation)
+    return conversation
+
+# ---------- Message CRUD ----------
+
+async def create_message(
+    db: AsyncDB,
+    conversation_id: int,
+    content: str,
+    role: models.MessageRole,
+    ai_confidence: Optional[int] = None,
+    ai_action: Optional[str] = None
+) -> models.Message:
+    """Create a new message in a conversation."""
+    if isinstance(db, Session):
+        return await run_in_threadpool(
+            crud.create_message, db, conversation_id, content, role, ai_confidence, ai_action
+        )
+
+    message = models.Message(
+        conversation_id=conversation_id,
+        content=content,
+        role=role,
+        ai_confidence=ai_confidence,
+        ai_action=ai_action
+    )
+    db.add(message)
+
+    # Update conversation's updated_at timestamp and latest exchange summary
+    await db.execute(
+        update(models.Conversation)
+        .where(models.Conversation.id == conversation_id)
+        .values(updated_at=func.now(), **crud.summary_update_values(role, content))
+    )
+
+    await db.commit()
+    await db.refresh(message)
+    return message
+
+# ---------- Assist unit of work ----------
+
+async def create_assist_exchange(
+    db: AsyncDB,
+    question: str,
+    ai_action: str,
+    ai_confidence: Optional[int] = None,
+    reply_text: str = "",
+    user_id: Optional[int] = None,
+    ticket_in: Optional[schemas.TicketCreate] = None,
+    duplicate_of_id: Optional[int] = None,
+) -> Tuple[models.Conversation, models.Message, Optional[models.Ticket]]:
+    """Async counterpart of crud.create_assist_exchange (one flush, one commit)."""
+    if isinstance(db, Session):
+        def create_and_load():
+            created = crud.create_assist_exchange(
+                db, question, ai_action, ai_confidence, reply_text, user_id, ticket_in, duplicate_of_id
+            )
+            # Reload expired rows in the worker thread, not lazily on the event loop
+            for obj in created:
+                if obj is not None:
+                    db.refresh(obj)
+            return created
+
+        return await run_in_threadpool(create_and_load)
+
+    conversation, ticket = crud.build_assist_exchange(question, user_id, ticket_in, duplicate_of_id)
+    db.add(conversation)
+    if ticket is not None:
+        db.add(ticket)
+        await db.flush()  # Assigns ids for the deferred notice
+        crud.defer_reply(db, conversation.id, crud.escalation_notice(ticket), ai_confidence, ai_action)
+        await db.commit()
+        return conversation, None, ticket
+
+    reply = models.Message(
+        content=reply_text,
+        role=models.MessageRole.ASSISTANT,
+        ai_confidence=ai_confidence,
+        ai_action=ai_action,
+    )
+    conversation.messages.append(reply)
+    conversation.last_answer = reply_text
+    conversation.last_answer_at = func.now()
+    await db.commit()
+    return conversation, reply, ticket
+
+async def attach_assist_exchange(
+    db: AsyncDB,
+    question: str,
+    ticket_id: int,
+    ai_action: str = "escalate",
+    ai_confidence: Optional[int] = None,
+    user_id: Optional[int] = None,
+) -> Optional[Tuple[models.Conversation, models.Message, models.Ticket]]:
+    """Async counterpart of crud.attach_assist_exchange."""
+    if isinstance(db, Session):
+        def attach_and_load():
+            attached = crud.attach_assist_exchange(db, question, ticket_id, ai_action, ai_confidence, user_id)
+            if attached is not None:
+                for obj in attached:
+                    if obj is not None:
+                        db.refresh(obj)
+            return attached
+
+        return await run_in_threadpool(attach_and_load)
+
+    ticket = await db.get(models.Ticket, ticket_id)
+    if ticket is None or ticket.status not in dedup.OPEN_STATUSES:
+        return None
+    conversation, _ = crud.build_assist_exchange(question, user_id)
+    db.add(conversation)
+    await db.flush()  # Assigns conversation.id for the deferred notice
+    crud.defer_reply(db, conversation.id, crud.duplicate_notice(ticket), ai_confidence, ai_action)
+    jobs.enqueue(db, "ticket_duplicates", {"ticket_id": ticket.id, "count": 1})
+    await db.commit()
+    return conversation, None, ticket
+
+async def create_assist_exchanges(db: AsyncDB, exchanges: List[dict]) -> List[tuple]:
+    """Async counterpart of crud.create_assist_exchanges."""
+    if isinstance(db, Session):
+        def create_and_keep():
+            # Like AsyncSessionLocal: keep ids and statuses loaded instead of refreshing every row
+            db.expire_on_commit = False
+            try:
+                return crud.create_assist_exchanges(db, exchanges)
+            finally:
+                db.expire_on_commit = True
+
+        return await run_in_threadpool(create_and_keep)
+
+    stmt = crud.attach_targets(exchanges)
+    open_tickets = {t.id: t for t in await db.scalars(stmt)} if stmt is not None else {}
+    results = await db.run_sync(crud.insert_assist_exchanges, exchanges, open_tickets)
+    await db.commit()
+    return results
+
+# ---------- Helper Functions ----------
+
+async def update_conversation_title(db: AsyncDB, conversation_id: int) -> Optional[models.Conversation]:
+    """Auto-generate and update conversation title if not set."""
+    if isinstance(db, Session):
+        return await run_in_threadpool(crud.update_conversation_title, db, conversation_id)
+
+    conversation = await db.get(models.Conversation, conversation_id)
+
+    if conversation and not conversation.title:
+        first_content = await db.scalar(
+            select(models.Message.content)
+            .where(models.Message.conversation_id == conversation_id,
+                   models.Message.role == models.MessageRole.USER)
+            .order_by(models.Message.created_at.asc())
+            .limit(1)
+        )
+        conversation.title = crud.title_from_message(first_content) if first_content else "New Conversation"
+        await db.commit()
+        await db.refresh(conversation)
+
+    return conversation
@@ -1,5 +1,9 @@
 # app/db.py
+import importlib
+from typing import Optional
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import settings
 
@@ -11,3 +15,44 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 Base = declarative_base()
+
+# backend name -> (async drivername, module that must be importable)
+_ASYNC_DRIVERS = {
+    "sqlite": ("sqlite+aiosqlite", "aiosqlite"),
+    "postgresql": ("postgresql+asyncpg", "asyncpg"),
+}
+
+def async_database_url(url: str) -> Optional[URL]:
+    """Map DATABASE_URL onto its async driver, or None if no async driver is installed."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        return None
+    drivername, module = _ASYNC_DRIVERS[backend]
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        return None
+
+    if drivername == "postgresql+asyncpg":
+        # asyncpg spells libpq's sslmode as ssl and has no channel_binding option
+        query = dict(parsed.query)
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        query.pop("channel_binding", None)
+        parsed = parsed.set(query=query)
+    return parsed.set(drivername=drivername)
+
+_async_url = async_database_url(settings.database_url)
+
+# None when no async driver is available; async routes then offload sync sessions to a thread
+async_engine: Optional[AsyncEngine] = (
+    create_async_engine(_async_url, pool_pre_ping=True, pool_size=10, max_overflow=20)
+    if _async_url is not None
+    else None
+)
+AsyncSessionLocal = (
+    async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+    if async_engine is not None
+    else None
+)
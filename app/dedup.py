@@ -0,0 +1,209 @@
+"""
+Near-duplicate ticket detection.
+
+Each open ticket's title and description are reduced to a MinHash signature
+over character shingles; locality-sensitive hashing buckets the signatures by
+band so candidate duplicates are found without comparing against every open
+ticket. Candidates are confirmed by estimated Jaccard similarity.
+"""
+
+import threading
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import models
+from .cache import normalize_message
+from .config import settings
+
+NUM_PERM = 128
+BANDS = 32  # 32 bands x 4 rows: pairs above ~0.42 Jaccard usually share a bucket
+ROWS = NUM_PERM // BANDS
+SHINGLE = 4
+
+# Universal hashing (a * x + b) mod p with p > 2**32, so products fit in uint64
+_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(20240611)  # Fixed seed: signatures must agree across processes
+_A = _rng.integers(1, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+
+OPEN_STATUSES = ("open", "in_progress")
+
+
+def ticket_text(title: str, description: Optional[str]) -> str:
+    return f"{title} {description or ''}"
+
+
+def shingles(text: str) -> Set[int]:
+    """Hashed character shingles of the normalized text (whole text if shorter)."""
+    text = normalize_message(text)
+    if len(text) <= SHINGLE:
+        return {zlib.crc32(text.encode("utf-8"))} if text else set()
+    return {zlib.crc32(text[i:i + SHINGLE].encode("utf-8")) for i in range(len(text) - SHINGLE + 1)}
+
+
+def signature(text: str) -> Optional[np.ndarray]:
+    values = shingles(text)
+    if not values:
+        return None
+    x = np.fromiter(values, dtype=np.uint64, count=len(values))
+    return ((np.outer(x, _A) + _B) % _PRIME).min(axis=0)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity: the share of matching MinHash values."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+class DuplicateIndex:
+    """LSH index of open tickets' MinHash signatures."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._signatures: Dict[int, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, Set[int]]] = [defaultdict(set) for _ in range(BANDS)]
+        self.lookups = 0
+        self.matches = 0
+        self.attached = 0
+        self.flagged = 0
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    @staticmethod
+    def _bands(sig: np.ndarray) -> List[bytes]:
+        return [sig[i * ROWS:(i + 1) * ROWS].tobytes() for i in range(BANDS)]
+
+    def add(self, ticket_id: int, text: str) -> None:
+        sig = signature(text)
+        with self._lock:
+            self._discard(ticket_id)
+            if sig is None:
+                return
+            self._signatures[ticket_id] = sig
+            for band, key in enumerate(self._bands(sig)):
+                self._buckets[band][key].add(ticket_id)
+
+    def _discard(self, ticket_id: int) -> bool:
+        sig = self._signatures.pop(ticket_id, None)
+        if sig is None:
+            return False
+        for band, key in enumerate(self._bands(sig)):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(ticket_id)
+                if not bucket:
+                    del self._buckets[band][key]
+        return True
+
+    def remove(self, ticket_id: int) -> bool:
+        with self._lock:
+            return self._discard(ticket_id)
+
+    def _candidates(self, sig: np.ndarray) -> Set[int]:
+        found: Set[int] = set()
+        for band, key in enumerate(self._bands(sig)):
+            found |= self._buckets[band].get(key, set())
+        return found
+
+    def find(self, text: str, threshold: Optional[float] = None) -> Optional[Tuple[int, float]]:
+        """The most similar open ticket at or above ``threshold``, as (ticket id, similarity)."""
+        threshold = settings.dedup_threshold if threshold is None else threshold
+        sig = signature(text)
+        with self._lock:
+            self.lookups += 1
+            if sig is None:
+                return None
+            best = None
+            for ticket_id in self._candidates(sig):
+                score = similarity(sig, self._signatures[ticket_id])
+                if score >= threshold and (best is None or (score, -ticket_id) > (best[1], -best[0])):
+                    best = (ticket_id, score)
+            if best is not None:
+                self.matches += 1
+            return best
+
+    def clusters(self, threshold: Optional[float] = None) -> List[List[int]]:
+        """Groups of two or more open tickets linked by pairwise similarity, largest first."""
+        threshold = settings.dedup_threshold if threshold is None else threshold
+        with self._lock:
+            parent = {ticket_id: ticket_id for ticket_id in self._signatures}
+
+            def root(x: int) -> int:
+                while parent[x] != x:
+                    parent[x] = parent[parent[x]]
+                    x = parent[x]
+                return x
+
+            checked = set()
+            for buckets in self._buckets:
+                for members in buckets.values():
+                    if len(members) < 2:
+                        continue
+                    ordered = sorted(members)
+                    for i, a in enumerate(ordered):
+                        for b in ordered[i + 1:]:
+                            if (a, b) in checked:
+                                continue
+                            checked.add((a, b))
+                            if similarity(self._signatures[a], self._signatures[b]) >= threshold:
+                                parent[root(a)] = root(b)
+
+            groups: Dict[int, List[int]] = defaultdict(list)
+            for ticket_id in parent:
+                groups[root(ticket_id)].append(ticket_id)
+        clusters = [sorted(ids) for ids in groups.values() if len(ids) > 1]
+        return sorted(clusters, key=lambda ids: (-len(ids), ids[0]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": settings.dedup_mode,
+            "threshold": settings.dedup_threshold,
+            "open_tickets": len(self._signatures),
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "attached": self.attached,
+            "flagged": self.flagged,
+        }
+
+
+index = DuplicateIndex()
+
+
+def is_open(ticket: models.Ticket) -> bool:
+    return ticket.status in OPEN_STATUSES
+
+
+def build(db: Session) -> int:
+    """Index every open ticket; returns how many were indexed."""
+    rows = db.execute(
+        select(models.Ticket.id, models.Ticket.title, models.Ticket.description)
+        .where(models.Ticket.status.in_(OPEN_STATUSES))
+    ).all()
+    for row in rows:
+        index.add(row.id, ticket_text(row.title, row.description))
+    return len(index)
+
+
+def find_duplicate(title: str, description: Optional[str]) -> Optional[int]:
+    """Id of an open ticket this one duplicates, or None (always None when dedup_mode is off)."""
+    if settings.dedup_mode == "off":
+        return None
+    match = index.find(ticket_text(title, description))
+    return match[0] if match else None
+
+
+def sync_ticket(ticket: models.Ticket) -> None:
+    """Index a created or edited ticket while it is open; drop it once it is not."""
+    if settings.dedup_mode == "off":
+        return
+    if is_open(ticket):
+        index.add(ticket.id, ticket_text(ticket.title, ticket.description))
+    else:
+        index.remove(ticket.id)
+
+
+def forget_ticket(ticket_id: int) -> None:
+    index.remove(ticket_id)
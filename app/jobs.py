@@ -0,0 +1,252 @@
+"""
+Persistent background jobs.
+
+Follow-up work the caller does not need to wait for (conversation titles,
+assistant notices, ticket bookkeeping) is written to the ``jobs`` table in the
+same transaction as the rows it depends on, then run by an in-process worker
+after the response has gone out. The table makes the queue restart-safe:
+pending jobs are picked up again on the next start, and a job left running by
+a crashed worker is reclaimed once its lock times out. Failed jobs are retried
+with exponential backoff and dead-lettered after ``jobs_max_attempts``.
+
+Handlers are registered with ``@handler(kind)`` and run in a fresh Session
+that is committed together with the job's removal; they must not commit.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import and_, delete, event, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from . import models
+from .config import settings
+from .db import SessionLocal
+
+PENDING = "pending"
+RUNNING = "running"
+DEAD = "dead"
+
+MAX_RETRY_DELAY = 300.0  # Seconds; caps the exponential backoff
+
+HANDLERS: Dict[str, Callable[[Session, Dict[str, Any]], None]] = {}
+
+
+def handler(kind: str):
+    """Register a function ``fn(db, payload)`` as the handler for ``kind`` jobs."""
+    def register(fn: Callable[[Session, Dict[str, Any]], None]):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(db, kind: str, payload: Dict[str, Any], delay: float = 0.0) -> models.Job:
+    """
+    Add a job to ``db`` (a Session or AsyncSession) without committing, so it
+    is stored atomically with the caller's own writes.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"No handler registered for job kind {kind!r}")
+    job = models.Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        status=PENDING,
+        attempts=0,
+        max_attempts=settings.jobs_max_attempts,
+        run_at=time.time() + delay,
+    )
+    db.add(job)
+    db.info["jobs_enqueued"] = True
+    return job
+
+
+def enqueue_many(db: Session, kind: str, payloads: List[Dict[str, Any]]) -> None:
+    """Like ``enqueue`` for many jobs at once, as one executemany INSERT (sync Session only)."""
+    if not payloads:
+        return
+    if kind not in HANDLERS:
+        raise ValueError(f"No handler registered for job kind {kind!r}")
+    now = time.time()
+    db.execute(insert(models.Job), [
+        {
+            "kind": kind,
+            "payload": json.dumps(payload),
+            "status": PENDING,
+            "attempts": 0,
+            "max_attempts": settings.jobs_max_attempts,
+            "run_at": now,
+        }
+        for payload in payloads
+    ])
+    db.info["jobs_enqueued"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session) -> None:
+    if session.info.pop("jobs_enqueued", False):
+        worker.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_jobs(session: Session) -> None:
+    session.info.pop("jobs_enqueued", None)
+
+
+def retry_delay(attempts: int) -> float:
+    return min(settings.jobs_retry_base_seconds * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY)
+
+
+def _claimable(now: float):
+    Job = models.Job
+    return or_(
+        and_(Job.status == PENDING, Job.run_at <= now),
+        and_(Job.status == RUNNING, Job.locked_at < now - settings.jobs_lock_timeout_seconds),
+    )
+
+
+def claim(db: Session, limit: int) -> List[models.Job]:
+    """
+    Lock up to ``limit`` due jobs for this caller with one conditional UPDATE,
+    so concurrent workers (other processes included) never run the same job.
+    """
+    Job = models.Job
+    now = time.time()
+    ids = list(db.scalars(select(Job.id).where(_claimable(now)).order_by(Job.run_at).limit(limit)))
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    db.execute(
+        update(Job)
+        .where(Job.id.in_(ids), _claimable(now))
+        .values(status=RUNNING, locked_at=now, locked_by=token, attempts=Job.attempts + 1)
+    )
+    db.commit()
+    return list(db.scalars(select(Job).where(Job.locked_by == token).order_by(Job.run_at)))
+
+
+class JobWorker:
+    """Polls the jobs table on the event loop and runs handlers in a worker thread."""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.processed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = self._loop = self._wake = None
+
+    def wake(self) -> None:
+        """Skip the rest of the poll interval; safe to call from any thread."""
+        if self._loop is not None and self._wake is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wake.set)
+            except RuntimeError:  # Loop already closed
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                ran = await asyncio.to_thread(self.run_pending)
+            except Exception as e:
+                print(f"⚠️  Job worker error: {e}")
+                ran = 0
+            if ran:
+                continue  # More may be due
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.jobs_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def run_pending(self, limit: Optional[int] = None) -> int:
+        """Claim and run one batch of due jobs; returns how many were run."""
+        db = SessionLocal()
+        try:
+            claimed = claim(db, limit or settings.jobs_batch_size)
+        finally:
+            db.close()
+        for job in claimed:
+            self.run_job(job)
+        return len(claimed)
+
+    def run_job(self, job: models.Job) -> bool:
+        Job = models.Job
+        db = SessionLocal()
+        try:
+            try:
+                HANDLERS[job.kind](db, json.loads(job.payload))
+                db.execute(delete(Job).where(Job.id == job.id, Job.locked_by == job.locked_by))
+                db.commit()
+                self.processed += 1
+                return True
+            except Exception as e:
+                db.rollback()
+                error = f"{type(e).__name__}: {e}"
+            if job.attempts >= job.max_attempts:
+                values = {"status": DEAD, "locked_by": None}
+                self.dead_lettered += 1
+                print(f"❌ Job {job.id} ({job.kind}) dead-lettered after {job.attempts} attempts: {error}")
+            else:
+                values = {"status": PENDING, "locked_by": None, "run_at": time.time() + retry_delay(job.attempts)}
+                self.retried += 1
+            db.execute(
+                update(Job)
+                .where(Job.id == job.id, Job.locked_by == job.locked_by)
+                .values(last_error=error[:2000], **values)
+            )
+            db.commit()
+            return False
+        finally:
+            db.close()
+
+    def stats(self, db: Session) -> Dict[str, Any]:
+        Job = models.Job
+        depth = dict(db.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+        oldest_due = db.scalar(select(func.min(Job.run_at)).where(Job.status == PENDING, Job.run_at <= time.time()))
+        return {
+            "worker_running": self.running,
+            "pending": depth.get(PENDING, 0),
+            "running": depth.get(RUNNING, 0),
+            "dead": depth.get(DEAD, 0),
+            "oldest_due_seconds": round(time.time() - oldest_due, 3) if oldest_due is not None else 0.0,
+            "processed": self.processed,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+worker = JobWorker()
+
+
+def retry_dead(db: Session, kind: Optional[str] = None) -> int:
+    """Move dead-lettered jobs (optionally of one kind) back to pending with fresh attempts."""
+    Job = models.Job
+    stmt = update(Job).where(Job.status == DEAD)
+    if kind:
+        stmt = stmt.where(Job.kind == kind)
+    result = db.execute(stmt.values(status=PENDING, attempts=0, run_at=time.time(), locked_at=None))
+    db.commit()
+    if result.rowcount:
+        worker.wake()
+    return result.rowcount
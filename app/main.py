@@ -1,14 +1,19 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Depends, HTTPException, Query, Response, status, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
+from contextlib import aclosing
+import asyncio
+import secrets
 from datetime import timedelta
+import json
 from .config import settings
-from .db import Base, engine, SessionLocal
-from . import crud, schemas, ai, auth, models
+from .db import Base, async_engine, engine, SessionLocal
+from .pagination import InvalidCursor
+from . import crud, crud_async, schemas, ai, admission, auth, metrics, models, dedup, jobs, migrations, providers, querystats, resilience, retrieval, search
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
-from typing import List
+from typing import List, Literal, Union
 from fastapi.staticfiles import StaticFiles
 
 app = FastAPI(title=settings.app_name)
@@ -42,10 +47,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request query counts and DB time (Server-Timing, metrics, slow-query log, N+1 warnings)
+if settings.sql_instrumentation_enabled:
+    app.add_middleware(querystats.QueryStatsMiddleware)
+    querystats.instrument_engine(engine)
+    if async_engine is not None:
+        querystats.instrument_engine(async_engine.sync_engine)
+
+# Prometheus metrics (outermost middleware, so CORS and error handling are timed too)
+if settings.metrics_enabled:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_pool(engine, "sync")
+    if async_engine is not None:
+        metrics.instrument_pool(async_engine.sync_engine, "async")
+    metrics.registry.collector(metrics.cache_collector(lambda: {
+        "decision": ai.decision_cache.stats(),
+        "auth_principals": auth.principal_cache.stats(),
+        "auth_tokens": auth.token_cache.stats(),
+    }))
+
 @app.get("/")
 async def root():
     return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics(request: Request):
+    """Prometheus scrape endpoint; requires ``Authorization: Bearer <METRICS_TOKEN>`` when a token is set."""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.metrics_token and not secrets.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {settings.metrics_token}"
+    ):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/robots.txt", response_class=HTMLResponse)
 async def robots_txt():
     """Serve robots.txt to prevent 404 errors from web crawlers."""
@@ -67,7 +102,7 @@ async def favicon():
 
 @app.on_event("startup")
 def on_startup():
-    """Initialize database tables on startup only if needed."""
+    """Initialize database tables on startup only if needed, then apply pending migrations."""
     try:
         from sqlalchemy import inspect
         
@@ -76,7 +111,7 @@ def on_startup():
         existing_tables = inspector.get_table_names()
         
         # Core tables that should exist
-        required_tables = ["users", "tickets", "conversations", "messages"]
+        required_tables = ["users", "tickets", "conversations", "messages", "revoked_tokens", "jobs"]
         missing_tables = [table for table in required_tables if table not in existing_tables]
         
         if missing_tables:
@@ -85,11 +120,59 @@ def on_startup():
             print("✅ Database tables created successfully")
         else:
             print("✅ Database tables already exist, skipping initialization")
+
+        for m in migrations.upgrade(engine):
+            print(f"🔄 Applied migration {m.version}: {m.description}")
+
+        search.ensure_index(engine)
+
+        db = SessionLocal()
+        try:
+            auth.revoked_tokens.load(db)
+            if settings.retrieval_enabled:
+                print(f"✅ Retrieval index ready: {retrieval.load_or_build(db)} resolved tickets")
+            if settings.dedup_mode != "off":
+                print(f"✅ Duplicate index ready: {dedup.build(db)} open tickets")
+        finally:
+            db.close()
+
+        ai.router.load(settings.router_model_path, settings.router_rules_path)
             
     except Exception as e:
         print(f"⚠️  Database initialization warning: {e}")
         print("💡 You may need to run the migration script manually")
 
+@app.on_event("startup")
+async def start_http_client():
+    """Open the shared LLM HTTP client so its connection pool lives as long as the app."""
+    if settings.llm_provider == "openai":
+        providers.get_http_client()
+
+@app.on_event("startup")
+async def start_job_worker():
+    """Run queued background jobs (including any left over from before a restart)."""
+    if settings.jobs_worker_enabled:
+        jobs.worker.start()
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    await jobs.worker.stop()
+
+@app.on_event("shutdown")
+def save_retrieval_index():
+    """Write index changes still waiting for their debounced save."""
+    retrieval.flush()
+
+@app.on_event("shutdown")
+def close_decision_cache():
+    """Write cached decisions still queued for the on-disk cache."""
+    ai.decision_cache.close()
+
+@app.on_event("shutdown")
+async def close_http_client():
+    """Close pooled upstream connections on shutdown."""
+    await providers.close_http_client()
+
 def get_db():
     db = SessionLocal()
     try:
@@ -97,21 +180,95 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Session for async routes; see crud_async for the sync-driver fallback."""
+    db = crud_async.open_session()
+    try:
+        yield db
+    finally:
+        await crud_async.close_session(db)
+
+def _keyset_or_400(page_fn, *args, **kwargs):
+    """Run a keyset page query, turning a malformed cursor into a 400."""
+    try:
+        return page_fn(*args, **kwargs)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 # ---------- Tickets API ----------
 
 @app.post("/tickets", response_model=schemas.TicketRead, status_code=status.HTTP_201_CREATED)
 def create_ticket(ticket_in: schemas.TicketCreate, db: Session = Depends(get_db)):
-    return crud.create_ticket(db, ticket_in)
+    """Create a ticket; a near-duplicate of an open ticket is flagged via ``duplicate_of_id``."""
+    duplicate_of_id = dedup.find_duplicate(ticket_in.title, ticket_in.description)
+    ticket = crud.create_ticket(db, ticket_in, duplicate_of_id=duplicate_of_id)
+    dedup.sync_ticket(ticket)
+    if duplicate_of_id is not None:
+        dedup.index.flagged += 1
+    return ticket
 
-@app.get("/tickets", response_model=list[schemas.TicketRead])
+@app.post("/tickets/bulk", response_model=schemas.TicketBulkResult)
+def bulk_tickets(bulk_in: schemas.TicketBulkRequest, response: Response, db: Session = Depends(get_db)):
+    """
+    Create, update and delete many tickets in one transaction, with a result per
+    item. In "atomic" mode a single failure rolls everything back (409); in
+    "partial" mode the valid items are applied.
+    """
+    total = len(bulk_in.creates) + len(bulk_in.updates) + len(bulk_in.deletes)
+    if total > settings.tickets_bulk_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.tickets_bulk_max_items} items per request ({total} given)",
+        )
+    mode = bulk_in.mode or settings.tickets_bulk_mode
+    results = crud.bulk_tickets(
+        db, bulk_in.creates, bulk_in.updates, bulk_in.deletes, atomic=mode == "atomic"
+    )
+
+    applied = [r for r in results if r["ok"]]
+    changed = [r["ticket"] for r in applied if r.get("ticket") is not None]
+    deleted = [r["id"] for r in applied if r["op"] == "delete"]
+    retrieval.sync_tickets(changed, deleted)
+    for ticket in changed:
+        dedup.sync_ticket(ticket)
+    for ticket_id in deleted:
+        dedup.forget_ticket(ticket_id)
+    dedup.index.flagged += sum(1 for r in applied if r["op"] == "create" and r["ticket"].duplicate_of_id)
+
+    failed = len(results) - len(applied)
+    if failed and mode == "atomic":
+        response.status_code = status.HTTP_409_CONFLICT
+    return {
+        "mode": mode,
+        "created": sum(1 for r in applied if r["op"] == "create"),
+        "updated": sum(1 for r in applied if r["op"] == "update"),
+        "deleted": len(deleted),
+        "failed": failed,
+        "results": results,
+    }
+
+@app.get("/tickets", response_model=Union[list[schemas.TicketRead], schemas.TicketPage])
 def list_tickets(
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1),
     q: str | None = None,
     status: str | None = None,
+    mode: Literal["fulltext", "substring"] = "fulltext",
+    highlight: bool = False,
+    cursor: str | None = None,
     db: Session = Depends(get_db),
 ):
-    return crud.get_tickets(db, skip=skip, limit=limit, q=q, status=status)
+    """
+    List tickets. Passing ``cursor`` (empty for the first page) switches to
+    keyset pagination and returns ``{items, next_cursor}``; otherwise
+    ``skip``/``limit`` offset paging returns a plain list.
+    """
+    if cursor is not None:
+        items, next_cursor = _keyset_or_400(
+            crud.get_tickets_page, db, limit=limit, cursor=cursor, q=q, status=status, mode=mode, highlight=highlight
+        )
+        return schemas.TicketPage(items=items, next_cursor=next_cursor)
+    return crud.get_tickets(db, skip=skip, limit=limit, q=q, status=status, mode=mode, highlight=highlight)
 
 @app.get("/tickets/{ticket_id}", response_model=schemas.TicketRead)
 def read_ticket(ticket_id: int, db: Session = Depends(get_db)):
@@ -125,21 +282,25 @@ def update_ticket(ticket_id: int, ticket_in: schemas.TicketUpdate, db: Session =
     ticket = crud.update_ticket(db, ticket_id, ticket_in)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    retrieval.sync_ticket(ticket)
+    dedup.sync_ticket(ticket)
     return ticket
 
 @app.delete("/tickets/{ticket_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_ticket(ticket_id: int, db: Session = Depends(get_db)):
     if not crud.delete_ticket(db, ticket_id):
         raise HTTPException(status_code=404, detail="Ticket not found")
+    retrieval.forget_ticket(ticket_id)
+    dedup.forget_ticket(ticket_id)
     return {"detail": "Ticket deleted successfully"}
 
 # ---------- AI Assistant Webhook ----------
 
-@app.post("/webhook/assist-or-ticket")
+@app.post("/webhook/assist-or-ticket", dependencies=[Depends(admission.admit)])
 async def assist_or_ticket(
     assist_request: schemas.AssistRequest,
     request: Request,
-    db: Session = Depends(get_db),
+    db: crud_async.AsyncDB = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user_optional)
 ):
     """
@@ -150,60 +311,75 @@ async def assist_or_ticket(
     """
     try:
         # Get AI decision from Groq
-        decision = await ai.call_groq_api(assist_request.message)
+        decision = await ai.get_decision(assist_request.message)
 
-        # Always create a conversation + user message so it appears in history
+        # Always record the conversation so it appears in history
         user_id = current_user.id if current_user else None
-        conversation = crud.create_conversation(db, schemas.ConversationCreate(), user_id)
-        crud.create_message(db, conversation.id, assist_request.message, models.MessageRole.USER)
+        confidence = decision.get("confidence", 0.0)
+        ai_confidence = int(confidence * 100) if confidence else None
         
         # Provide direct answer
         if ai.should_answer_directly(decision):
             reply_text = decision.get("reply_text", "")
-            confidence = decision.get("confidence", 0.0)
-
-            # Save assistant message
-            crud.create_message(
+            conversation, _, _ = await crud_async.create_assist_exchange(
                 db,
-                conversation.id,
-                reply_text,
-                models.MessageRole.ASSISTANT,
-                ai_confidence=int(confidence * 100) if confidence else None,
-                ai_action="answer",
+                assist_request.message,
+                "answer",
+                ai_confidence,
+                reply_text=reply_text,
+                user_id=user_id,
             )
-            crud.update_conversation_title(db, conversation.id)
 
             return {
                 "action": "answer",
                 "confidence": confidence,
                 "reply_text": reply_text,
+                "source": decision.get("source", "llm"),
                 "conversation_id": conversation.id,
             }
         else:
-            # AI decided to escalate: create a ticket
+            # AI decided to escalate: attach to an open near-duplicate, or create a ticket
             ticket_data = ai.create_ticket_from_decision(assist_request.message, decision)
-            ticket = crud.create_ticket(db, ticket_data, user_id=user_id)
-
-            # Save assistant message summarizing the escalation
-            confidence = decision.get("confidence", 0.0)
-            ai_response = f"Ticket #{ticket.id} created (status: {ticket.status}). Our team will follow up."
-            crud.create_message(
-                db,
-                conversation.id,
-                ai_response,
-                models.MessageRole.ASSISTANT,
-                ai_confidence=int(confidence * 100) if confidence else None,
-                ai_action="escalate",
-            )
-            crud.update_conversation_title(db, conversation.id)
+            duplicate_of_id = dedup.find_duplicate(ticket_data.title, ticket_data.description)
+            attached = None
+            if duplicate_of_id is not None and settings.dedup_mode == "attach":
+                attached = await crud_async.attach_assist_exchange(
+                    db,
+                    assist_request.message,
+                    duplicate_of_id,
+                    "escalate",
+                    ai_confidence,
+                    user_id=user_id,
+                )
+            if attached is not None:
+                conversation, _, ticket = attached
+                dedup.index.attached += 1
+            else:
+                conversation, _, ticket = await crud_async.create_assist_exchange(
+                    db,
+                    assist_request.message,
+                    "escalate",
+                    ai_confidence,
+                    user_id=user_id,
+                    ticket_in=ticket_data,
+                    duplicate_of_id=duplicate_of_id,
+                )
+                dedup.sync_ticket(ticket)
+                if duplicate_of_id is not None:
+                    dedup.index.flagged += 1
             
             return {
                 "action": "escalate",
                 "ticket_id": ticket.id,
                 "status": ticket.status,
+                "duplicate_of": duplicate_of_id,
                 "conversation_id": conversation.id,
             }
             
+    except HTTPException:
+        raise  # Rate limited or at capacity: keep the 429/503 and its Retry-After
+    except resilience.LLMError as e:
+        raise resilience.http_error(e)
     except Exception as e:
         # API error - return error to user (don't create ticket)
         raise HTTPException(
@@ -211,6 +387,135 @@ async def assist_or_ticket(
             detail=f"AI service error: {str(e)}"
         )
 
+@app.post("/webhook/assist-or-ticket/batch")
+async def assist_or_ticket_batch(
+    batch_request: schemas.AssistBatchRequest,
+    current_user: models.User = Depends(auth.get_current_user_optional),
+    admit_item=Depends(admission.admit_each),
+):
+    """
+    Run /webhook/assist-or-ticket over many messages, streaming one NDJSON line
+    per message as it finishes (in completion order; ``index`` is its position
+    in ``messages``). Lines carry the single endpoint's payload, or ``error``.
+
+    Each message costs one rate-limit token: with none left the request gets
+    429, and messages beyond the remaining tokens get a 429 line instead.
+
+    Up to ``assist_batch_concurrency`` AI decisions run at once. Finished items
+    are persisted together: whatever completed while the previous write ran
+    (up to ``assist_batch_write_size``) goes out in one transaction.
+    """
+    messages = batch_request.messages
+    if len(messages) > settings.assist_batch_max_messages:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.assist_batch_max_messages} messages per request ({len(messages)} given)",
+        )
+    waits = [admit_item() for _ in messages]
+    if waits and waits[0]:
+        raise admission.rate_limited(waits[0])
+    user_id = current_user.id if current_user else None
+
+    async def result_stream():
+        semaphore = asyncio.Semaphore(max(1, settings.assist_batch_concurrency))
+        finished: asyncio.Queue = asyncio.Queue()
+
+        async def decide(index: int, message: str):
+            async with semaphore:
+                try:
+                    await finished.put((index, message, await ai.get_decision(message), None))
+                except resilience.LLMError as e:
+                    await finished.put((index, message, None, resilience.http_error(e)))
+                except Exception as e:
+                    await finished.put((index, message, None, e))
+
+        tasks = []
+        for i, (message, wait) in enumerate(zip(messages, waits)):
+            if wait:
+                finished.put_nowait((i, message, None, admission.rate_limited(wait)))
+            else:
+                tasks.append(asyncio.create_task(decide(i, message)))
+        # The request-scoped session is closed once streaming starts, so use a fresh one
+        stream_db = crud_async.open_session()
+        try:
+            remaining = len(messages)
+            while remaining:
+                batch = [await finished.get()]
+                while len(batch) < settings.assist_batch_write_size and not finished.empty():
+                    batch.append(finished.get_nowait())
+                remaining -= len(batch)
+                for line in await _persist_assist_batch(stream_db, batch, user_id):
+                    yield json.dumps(line) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            await crud_async.close_session(stream_db)
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+async def _persist_assist_batch(db: crud_async.AsyncDB, batch: list, user_id: int | None) -> List[dict]:
+    """Write the exchanges for a batch of (index, message, decision, error) and return their result lines."""
+    lines, exchanges, pending = [], [], []
+    for index, message, decision, error in batch:
+        if isinstance(error, HTTPException):
+            lines.append({"index": index, "error": error.detail, "status": error.status_code, **_retry_after(error)})
+            continue
+        if error is not None:
+            lines.append({"index": index, "error": f"AI service error: {str(error)}"})
+            continue
+        confidence = decision.get("confidence", 0.0)
+        exchange = {
+            "question": message,
+            "ai_confidence": int(confidence * 100) if confidence else None,
+            "user_id": user_id,
+        }
+        duplicate_of_id = None
+        if ai.should_answer_directly(decision):
+            exchange.update(ai_action="answer", reply_text=decision.get("reply_text", ""))
+        else:
+            ticket_data = ai.create_ticket_from_decision(message, decision)
+            duplicate_of_id = dedup.find_duplicate(ticket_data.title, ticket_data.description)
+            exchange.update(ai_action="escalate", ticket_in=ticket_data, duplicate_of_id=duplicate_of_id)
+            if settings.dedup_mode == "attach":
+                exchange["attach_to"] = duplicate_of_id
+        exchanges.append(exchange)
+        pending.append((index, decision, confidence, duplicate_of_id))
+    if not exchanges:
+        return lines
+
+    try:
+        created = await crud_async.create_assist_exchanges(db, exchanges)
+    except Exception as e:
+        await crud_async.rollback(db)
+        return lines + [{"index": index, "error": f"Database error: {str(e)}"} for index, *_ in pending]
+
+    for (index, decision, confidence, duplicate_of_id), (conversation, _, ticket, attached) in zip(pending, created):
+        if ticket is None:
+            lines.append({
+                "index": index,
+                "action": "answer",
+                "confidence": confidence,
+                "reply_text": decision.get("reply_text", ""),
+                "source": decision.get("source", "llm"),
+                "conversation_id": conversation.id,
+            })
+            continue
+        if attached:
+            dedup.index.attached += 1
+        else:
+            dedup.sync_ticket(ticket)
+            if duplicate_of_id is not None:
+                dedup.index.flagged += 1
+        lines.append({
+            "index": index,
+            "action": "escalate",
+            "ticket_id": ticket.id,
+            "status": ticket.status,
+            "duplicate_of": duplicate_of_id,
+            "conversation_id": conversation.id,
+        })
+    return lines
+
 # ---------- Authentication Routes ----------
 
 @app.get("/login", response_class=HTMLResponse)
@@ -224,9 +529,9 @@ def signup_page(request: Request):
     return templates.TemplateResponse("signup.html", {"request": request})
 
 @app.post("/auth/signup", response_model=schemas.Token)
-def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
     """Register a new user."""
-    db_user = auth.create_user(db, user)
+    db_user = await auth.create_user_async(db, user)
     
     # Create access token
     access_token_expires = timedelta(hours=settings.access_token_expire_hours)
@@ -253,9 +558,9 @@ def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return response
 
 @app.post("/auth/login", response_model=schemas.Token)
-def login(user_login: schemas.UserLogin, db: Session = Depends(get_db)):
+async def login(user_login: schemas.UserLogin, db: Session = Depends(get_db)):
     """Login user and return access token."""
-    user = auth.authenticate_user(db, user_login.username, user_login.password)
+    user = await auth.authenticate_user_async(db, user_login.username, user_login.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -291,38 +596,19 @@ def get_current_user_info(current_user: models.User = Depends(auth.get_current_u
     return schemas.UserRead.model_validate(current_user)
 
 @app.post("/auth/logout")
-def logout():
-    """Logout user: clear httpOnly cookie."""
+def logout(request: Request, db: Session = Depends(get_db)):
+    """Logout user: revoke the presented token and clear httpOnly cookie."""
+    token = auth.token_from_request(request)
+    if token:
+        auth.revoke_token(db, token)
     response = JSONResponse({"message": "Successfully logged out"})
     response.delete_cookie("access_token", path="/")
     return response
 
 @app.post("/auth/create-admin", response_model=schemas.Token)
-def create_admin(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_admin(user: schemas.UserCreate, db: Session = Depends(get_db)):
     """Create an admin user. For setup purposes only."""
-    # Check if username or email already exists
-    if auth.get_user_by_username(db, user.username):
-        raise HTTPException(
-            status_code=400,
-            detail="Username already registered"
-        )
-    if auth.get_user_by_email(db, user.email):
-        raise HTTPException(
-            status_code=400,
-            detail="Email already registered"
-        )
-    
-    # Create admin user
-    hashed_password = auth.hash_password(user.password)
-    db_user = models.User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password,
-        role="admin"  # Admin role
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    db_user = await auth.create_user_async(db, user, role="admin")
     
     # Create access token
     access_token_expires = timedelta(hours=settings.access_token_expire_hours)
@@ -362,13 +648,64 @@ def admin_tickets(
     current_admin: models.User = Depends(auth.get_current_admin_user)
 ):
     """Admin dashboard for viewing tickets."""
-    items = crud.get_tickets(db, q=q, status=status, limit=200)
+    items = crud.get_tickets(db, q=q, status=status, limit=200, highlight=True)
     admin_data = schemas.UserRead.model_validate(current_admin)
     return templates.TemplateResponse(
         "tickets.html",
         {"request": request, "items": items, "q": q or "", "status": status or "", "admin": admin_data},
     )
 
+@app.get("/admin/stats")
+def admin_stats(
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth.get_current_admin_user),
+):
+    """Runtime counters for admin diagnostics."""
+    return {
+        "decision_cache": ai.decision_cache.stats(),
+        "coalescing": ai.inflight_decisions.stats(),
+        "auth": auth.auth_stats(),
+        "password_hashing": auth.password_pool.stats(),
+        "retrieval": retrieval.index.stats(),
+        "router": ai.router.stats(),
+        "dedup": dedup.index.stats(),
+        "jobs": jobs.worker.stats(db),
+        "admission": admission.stats(),
+        "llm": providers.stats(),
+    }
+
+@app.post("/admin/jobs/retry-dead")
+def retry_dead_jobs(
+    kind: str | None = None,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth.get_current_admin_user),
+):
+    """Requeue dead-lettered background jobs (optionally only one ``kind``)."""
+    return {"requeued": jobs.retry_dead(db, kind)}
+
+@app.get("/admin/tickets/clusters", response_model=List[schemas.TicketCluster])
+def ticket_clusters(
+    threshold: float | None = Query(None, gt=0, le=1),
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth.get_current_admin_user),
+):
+    """Group open tickets that are near-duplicates of each other, largest cluster first."""
+    clusters = dedup.index.clusters(threshold)
+    ids = [ticket_id for cluster in clusters for ticket_id in cluster]
+    tickets = {t.id: t for t in db.query(models.Ticket).filter(models.Ticket.id.in_(ids))} if ids else {}
+    result = []
+    for cluster in clusters:
+        members = [tickets[i] for i in cluster if i in tickets]
+        if len(members) > 1:
+            result.append(schemas.TicketCluster(size=len(members), tickets=members))
+    return result
+
+@app.delete("/admin/cache/decisions")
+def invalidate_decision_cache(current_admin: models.User = Depends(auth.get_current_admin_user)):
+    """Drop every cached AI decision (e.g. after changing the model or prompt)."""
+    removed = ai.decision_cache.clear()
+    return {"detail": "Decision cache cleared", "removed": removed}
+
 # ---------- Conversation API Endpoints (Phase 1) ----------
 
 @app.post("/conversations", response_model=schemas.ConversationRead, status_code=status.HTTP_201_CREATED)
@@ -382,37 +719,63 @@ def create_conversation(
     conversation = crud.create_conversation(db, conversation_in, user_id)
     return schemas.ConversationRead.model_validate(conversation)
 
-@app.get("/conversations", response_model=list[schemas.ConversationRead])
+@app.get("/conversations", response_model=Union[list[schemas.ConversationRead], schemas.ConversationPage])
 def list_conversations(
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user_optional)
 ):
-    """List conversations for the current user (or all if admin/no auth)."""
+    """
+    List conversations for the current user (or all if admin/no auth).
+    Pass ``cursor`` (empty for the first page) for keyset pagination.
+    """
     user_id = current_user.id if current_user else None
+    if cursor is not None:
+        conversations, next_cursor = _keyset_or_400(
+            crud.get_conversations_page, db, user_id=user_id, limit=limit, cursor=cursor
+        )
+        return schemas.ConversationPage(
+            items=[schemas.ConversationRead.model_validate(conv) for conv in conversations],
+            next_cursor=next_cursor,
+        )
     conversations = crud.get_conversations(db, user_id=user_id, skip=skip, limit=limit)
     return [schemas.ConversationRead.model_validate(conv) for conv in conversations]
 
 @app.get("/conversations/{conversation_id}", response_model=schemas.ConversationWithMessages)
 def get_conversation(
     conversation_id: int, 
+    tail: int | None = Query(None, ge=1),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user_optional)
 ):
-    """Get a conversation with all its messages."""
+    """
+    Get a conversation with all its messages, or only the latest ``tail``
+    messages (use ``next_cursor`` with /conversations/{id}/messages?order=desc for older ones).
+    """
     user_id = current_user.id if current_user else None
-    conversation = crud.get_conversation_with_messages(db, conversation_id, user_id)
-    if not conversation:
+    return _conversation_with_messages(db, conversation_id, user_id, tail)
+
+@app.get("/conversations/{conversation_id}/messages", response_model=schemas.MessagePage)
+def list_messages(
+    conversation_id: int,
+    limit: int = Query(100, ge=1),
+    cursor: str | None = None,
+    order: Literal["asc", "desc"] = "asc",
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user_optional)
+):
+    """Keyset-paginated messages of a conversation, oldest first (or newest first with order=desc)."""
+    user_id = current_user.id if current_user else None
+    if not crud.get_conversation(db, conversation_id, user_id):
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    # Convert to schema
-    conv_data = schemas.ConversationRead.model_validate(conversation)
-    messages_data = [schemas.MessageRead.model_validate(msg) for msg in conversation.messages]
-    
-    return schemas.ConversationWithMessages(
-        **conv_data.model_dump(),
-        messages=messages_data
+    messages, next_cursor = _keyset_or_400(
+        crud.get_messages_page, db, conversation_id, limit=limit, cursor=cursor, newest_first=order == "desc"
+    )
+    return schemas.MessagePage(
+        items=[schemas.MessageRead.model_validate(msg) for msg in messages],
+        next_cursor=next_cursor,
     )
 
 @app.delete("/conversations/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -441,6 +804,10 @@ def create_message(
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
+    # Title the conversation in the background if it has none; committed with the message
+    if not conversation.title:
+        jobs.enqueue(db, "conversation_title", {"conversation_id": conversation_id})
+
     # Create user message
     message = crud.create_message(
         db, 
@@ -449,17 +816,14 @@ def create_message(
         models.MessageRole.USER
     )
     
-    # Update conversation title if not set
-    crud.update_conversation_title(db, conversation_id)
-    
     return schemas.MessageRead.model_validate(message)
 
 # ---------- Basic Chat Endpoint (Phase 1) ----------
 
-@app.post("/chat", response_model=schemas.ChatResponse)
+@app.post("/chat", response_model=schemas.ChatResponse, dependencies=[Depends(admission.admit)])
 async def chat(
     chat_request: schemas.ChatSendMessage,
-    db: Session = Depends(get_db),
+    db: crud_async.AsyncDB = Depends(get_async_db),
     current_user: models.User = Depends(auth.get_current_user_optional)
 ):
     """
@@ -469,45 +833,22 @@ async def chat(
     try:
         user_id = current_user.id if current_user else None
         
-        # Create new conversation
-        conversation = crud.create_conversation(db, schemas.ConversationCreate(), user_id)
-        
-        # Add user message
-        crud.create_message(
-            db, 
-            conversation.id, 
-            chat_request.message, 
-            models.MessageRole.USER
-        )
-        
         # Get AI response (using existing AI logic)
-        decision = await ai.call_groq_api(chat_request.message)
+        decision = await ai.get_decision(chat_request.message)
         
         # Determine action and response
-        if ai.should_answer_directly(decision):
-            # AI provides direct answer
-            ai_response = decision.get("reply_text", "I'm here to help!")
-            action = "answer"
-            confidence = decision.get("confidence", 0.0)
-        else:
-            # AI suggests escalation
-            ai_response = f"I'd recommend creating a support ticket for: {decision.get('short_title', 'Support Issue')}"
-            action = "escalate"
-            confidence = decision.get("confidence", 0.0)
+        ai_response, action, confidence = ai.chat_reply_from_decision(decision)
         
-        # Add AI response message
-        ai_message = crud.create_message(
+        # Save conversation, user message and AI response in one transaction
+        conversation, ai_message, _ = await crud_async.create_assist_exchange(
             db,
-            conversation.id,
-            ai_response,
-            models.MessageRole.ASSISTANT,
-            ai_confidence=int(confidence * 100) if confidence else None,
-            ai_action=action
+            chat_request.message,
+            action,
+            int(confidence * 100) if confidence else None,
+            reply_text=ai_response,
+            user_id=user_id,
         )
         
-        # Update conversation title
-        crud.update_conversation_title(db, conversation.id)
-        
         return schemas.ChatResponse(
             conversation_id=conversation.id,
             message_id=ai_message.id,
@@ -516,12 +857,101 @@ async def chat(
             confidence=confidence
         )
         
+    except HTTPException:
+        raise
+    except resilience.LLMError as e:
+        raise resilience.http_error(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Chat service error: {str(e)}"
         )
 
+def _retry_after(e: HTTPException) -> dict:
+    """``{"retry_after": seconds}`` for an overload error raised after the response started."""
+    value = (e.headers or {}).get("Retry-After")
+    return {"retry_after": int(value)} if value else {}
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream", dependencies=[Depends(admission.admit)])
+async def chat_stream(
+    chat_request: schemas.ChatSendMessage,
+    db: crud_async.AsyncDB = Depends(get_async_db),
+    current_user: models.User = Depends(auth.get_current_user_optional)
+):
+    """
+    Streaming variant of /chat using Server-Sent Events.
+    
+    Events: ``conversation`` (id of the new conversation), ``token`` (reply text
+    fragments as the model generates them), then ``done`` with the same payload
+    as /chat, or ``error``. The ``done`` response is authoritative: on
+    escalation it replaces the streamed text. The assistant message is saved
+    once the stream finishes; if the client disconnects first, the upstream
+    request is closed and nothing is saved.
+    """
+    user_id = current_user.id if current_user else None
+    conversation = await crud_async.create_conversation(db, schemas.ConversationCreate(), user_id)
+    await crud_async.create_message(db, conversation.id, chat_request.message, models.MessageRole.USER)
+    conversation_id = conversation.id
+
+    async def event_stream():
+        yield _sse("conversation", {"conversation_id": conversation_id})
+
+        decision = None
+        try:
+            async with aclosing(ai.stream_decision(chat_request.message)) as events:
+                async for kind, value in events:
+                    if kind == "token":
+                        yield _sse("token", {"text": value})
+                    else:
+                        decision = value
+        except resilience.LLMError as e:
+            e = resilience.http_error(e)
+            yield _sse("error", {"detail": e.detail, "status": e.status_code, **_retry_after(e)})
+            return
+        except HTTPException as e:
+            yield _sse("error", {"detail": e.detail, "status": e.status_code, **_retry_after(e)})
+            return
+        except Exception as e:
+            yield _sse("error", {"detail": f"Chat service error: {str(e)}"})
+            return
+
+        ai_response, action, confidence = ai.chat_reply_from_decision(decision)
+
+        # The request-scoped session is closed once streaming starts, so use a fresh one
+        stream_db = crud_async.open_session()
+        try:
+            # Titling is deferred to the job queue; the job is committed with the reply
+            jobs.enqueue(stream_db, "conversation_title", {"conversation_id": conversation_id})
+            ai_message = await crud_async.create_message(
+                stream_db,
+                conversation_id,
+                ai_response,
+                models.MessageRole.ASSISTANT,
+                ai_confidence=int(confidence * 100) if confidence else None,
+                ai_action=action
+            )
+            message_id = ai_message.id
+        finally:
+            await crud_async.close_session(stream_db)
+
+        yield _sse("done", schemas.ChatResponse(
+            conversation_id=conversation_id,
+            message_id=message_id,
+            response=ai_response,
+            action=action,
+            confidence=confidence
+        ).model_dump())
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ---------- History API ----------
 
 @app.get("/history", response_model=List[schemas.QueryHistoryItem])
@@ -536,16 +966,37 @@ def get_history(
 @app.get("/history/{conversation_id}", response_model=schemas.ConversationWithMessages)
 def get_history_detail(
     conversation_id: int,
+    tail: int | None = Query(None, ge=1),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    """Return full conversation messages for a given conversation id (owned by user)."""
-    conversation = crud.get_conversation_with_messages(db, conversation_id, current_user.id)
-    if not conversation:
-        raise HTTPException(status_code=404, detail="Conversation not found")
+    """Return full conversation messages (or the latest ``tail``) for a given conversation id (owned by user)."""
+    return _conversation_with_messages(db, conversation_id, current_user.id, tail)
+
+def _conversation_with_messages(
+    db: Session,
+    conversation_id: int,
+    user_id: int | None,
+    tail: int | None = None,
+) -> schemas.ConversationWithMessages:
+    """Build a conversation response with every message, or just the last ``tail`` ones."""
+    next_cursor = None
+    if tail:
+        conversation = crud.get_conversation(db, conversation_id, user_id)
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        messages, next_cursor = crud.get_messages_page(db, conversation_id, limit=tail, newest_first=True)
+        messages.reverse()
+    else:
+        conversation = crud.get_conversation_with_messages(db, conversation_id, user_id)
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        messages = conversation.messages
+
     conv_data = schemas.ConversationRead.model_validate(conversation)
-    messages_data = [schemas.MessageRead.model_validate(msg) for msg in conversation.messages]
+    messages_data = [schemas.MessageRead.model_validate(msg) for msg in messages]
     return schemas.ConversationWithMessages(
         **conv_data.model_dump(),
-        messages=messages_data
+        messages=messages_data,
+        next_cursor=next_cursor
     )
@@ -0,0 +1,217 @@
+"""
+Maintenance commands for Helpdesk-AI.
+
+Usage:
+    python -m app.manage migrate         # create tables and apply pending migrations
+    python -m app.manage status          # list applied / pending migrations
+    python -m app.manage check-indexes   # EXPLAIN the hot crud queries and fail on full table scans
+    python -m app.manage backfill-summaries        # recompute every conversation's latest exchange
+    python -m app.manage check-summaries [--fix]   # compare stored summaries with messages
+    python -m app.manage build-retrieval-index     # rebuild the resolved-ticket index from the database
+    python -m app.manage train-router [--output model.npz]   # fit the pre-router on stored ai_action labels
+    python -m app.manage run-jobs                  # run due background jobs until none are left
+    python -m app.manage retry-dead-jobs [--kind K]   # requeue dead-lettered background jobs
+"""
+
+import argparse
+import re
+import sys
+from typing import Callable, List, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from . import ai, crud, jobs, migrations, retrieval
+from .config import settings
+from .db import Base, SessionLocal, engine
+
+# Tables whose full scans count as a failure (FTS shadow tables and subqueries are fine)
+INDEXED_TABLES = {"users", "tickets", "conversations", "messages"}
+
+# Representative calls for every hot query shape in crud.py
+HOT_QUERIES: List[Tuple[str, Callable[[Session], object]]] = [
+    ("tickets newest first", lambda db: crud.get_tickets(db, mode="substring")),
+    ("tickets by status", lambda db: crud.get_tickets(db, status="open", mode="substring")),
+    ("tickets page by status", lambda db: crud.get_tickets_page(db, status="open", mode="substring")),
+    ("ticket by id", lambda db: crud.get_ticket(db, 1)),
+    ("conversations of user", lambda db: crud.get_conversations(db, user_id=1)),
+    ("conversations page of user", lambda db: crud.get_conversations_page(db, user_id=1)),
+    ("conversation by id", lambda db: crud.get_conversation(db, 1, user_id=1)),
+    ("messages of conversation", lambda db: crud.get_messages(db, 1)),
+    ("messages tail", lambda db: crud.get_messages_page(db, 1, limit=50, newest_first=True)),
+    ("conversation title", lambda db: crud.generate_conversation_title(db, 1)),
+    ("user query history", lambda db: crud.get_user_query_history(db, user_id=1)),
+]
+
+_SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+_PG_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def _capture(fn: Callable[[Session], object]) -> List[Tuple[str, object]]:
+    """Run ``fn`` in a throwaway transaction and return the SQL it issued."""
+    captured = []
+    with engine.connect() as conn:
+        def record(_conn, cursor, statement, parameters, context, executemany):
+            captured.append((statement, parameters))
+
+        event.listen(conn, "before_cursor_execute", record)
+        db = Session(bind=conn)
+        try:
+            fn(db)
+        finally:
+            db.close()
+            event.remove(conn, "before_cursor_execute", record)
+            conn.rollback()
+    return captured
+
+
+def explain(statement: str, parameters) -> Tuple[List[str], List[str]]:
+    """Return (plan lines, fully scanned tables) for one statement."""
+    with engine.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            plan = [row[-1] for row in rows]
+            scans = [m.group(1) for line in plan if (m := _SQLITE_FULL_SCAN.match(line))]
+        else:
+            # Tiny test tables make seq scans cheapest; ask whether an index is usable at all
+            conn.exec_driver_sql("SET enable_seqscan = off")
+            rows = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters).all()
+            plan = [row[0] for row in rows]
+            scans = [m.group(1) for line in plan for m in _PG_FULL_SCAN.finditer(line)]
+        conn.rollback()
+    return plan, [table for table in scans if table in INDEXED_TABLES]
+
+
+def check_indexes(args) -> int:
+    failures = 0
+    for name, fn in HOT_QUERIES:
+        for statement, parameters in _capture(fn):
+            plan, scans = explain(statement, parameters)
+            verdict = f"FULL SCAN of {', '.join(scans)}" if scans else "ok"
+            print(f"[{'FAIL' if scans else ' OK '}] {name}: {verdict}")
+            for line in plan:
+                print(f"         {line}")
+            failures += bool(scans)
+    print(f"\n{failures} hot quer{'y' if failures == 1 else 'ies'} without an index")
+    return 1 if failures else 0
+
+
+def migrate(args) -> int:
+    Base.metadata.create_all(bind=engine)
+    ran = migrations.upgrade(engine)
+    for m in ran:
+        print(f"✅ Applied migration {m.version}: {m.description}")
+    if not ran:
+        print("✅ Database is up to date")
+    return 0
+
+
+def status(args) -> int:
+    pending = {m.version for m in migrations.pending(engine)}
+    for m in migrations.MIGRATIONS:
+        print(f"{'pending' if m.version in pending else 'applied':>8}  {m.version:>4}  {m.description}")
+    return 0
+
+
+def backfill_summaries(args) -> int:
+    with engine.begin() as conn:
+        written = crud.backfill_conversation_summaries(conn, batch_size=args.batch_size)
+    print(f"✅ Recomputed summaries for {written} conversations")
+    return 0
+
+
+def check_summaries(args) -> int:
+    with engine.begin() as conn:
+        mismatched = crud.check_conversation_summaries(conn, batch_size=args.batch_size)
+        if mismatched and args.fix:
+            for start in range(0, len(mismatched), args.batch_size):
+                crud.refresh_conversation_summaries(conn, mismatched[start:start + args.batch_size])
+    if not mismatched:
+        print("✅ All conversation summaries match their messages")
+        return 0
+    shown = ", ".join(str(i) for i in mismatched[:20]) + (" ..." if len(mismatched) > 20 else "")
+    if args.fix:
+        print(f"✅ Repaired {len(mismatched)} stale conversation summaries: {shown}")
+        return 0
+    print(f"❌ {len(mismatched)} stale conversation summaries: {shown} (rerun with --fix)")
+    return 1
+
+
+def build_retrieval_index(args) -> int:
+    db = SessionLocal()
+    try:
+        count = retrieval.build(db)
+    finally:
+        db.close()
+    where = settings.retrieval_index_path or "memory only; set RETRIEVAL_INDEX_PATH to persist"
+    print(f"✅ Indexed {count} resolved tickets ({where})")
+    return 0
+
+
+def train_router(args) -> int:
+    output = args.output or settings.router_model_path
+    if not output:
+        print("❌ Pass --output or set ROUTER_MODEL_PATH")
+        return 1
+    db = SessionLocal()
+    try:
+        examples = crud.routing_examples(db)
+    finally:
+        db.close()
+    try:
+        info = ai.router.train(examples)
+    except ValueError as e:
+        print(f"❌ {e} ({len(examples)} labelled messages)")
+        return 1
+    ai.router.save(output)
+    print(f"✅ Trained on {info['examples']} messages ({info['escalations']} escalations), "
+          f"train accuracy {info['train_accuracy']:.1%}")
+    precision = "n/a" if info["skip_precision"] is None else f"{info['skip_precision']:.1%}"
+    print(f"   Would escalate {info['would_skip']} locally at P >= {settings.router_escalate_threshold} "
+          f"(precision {precision}); saved to {output}")
+    return 0
+
+
+def run_jobs(args) -> int:
+    total = 0
+    while ran := jobs.worker.run_pending():
+        total += ran
+    w = jobs.worker
+    print(f"✅ Ran {total} jobs ({w.processed} succeeded, {w.retried} to retry, {w.dead_lettered} dead-lettered)")
+    return 0
+
+
+def retry_dead_jobs(args) -> int:
+    db = SessionLocal()
+    try:
+        requeued = jobs.retry_dead(db, args.kind)
+    finally:
+        db.close()
+    print(f"✅ Requeued {requeued} dead-lettered jobs")
+    return 0
+
+
+COMMANDS = {
+    "migrate": migrate,
+    "status": status,
+    "check-indexes": check_indexes,
+    "backfill-summaries": backfill_summaries,
+    "check-summaries": check_summaries,
+    "build-retrieval-index": build_retrieval_index,
+    "train-router": train_router,
+    "run-jobs": run_jobs,
+    "retry-dead-jobs": retry_dead_jobs,
+}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.manage", description="Helpdesk-AI maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--batch-size", type=int, default=500, help="Conversations per batch for the summary commands")
+    parser.add_argument("--fix", action="store_true", help="check-summaries: rewrite stale summaries")
+    parser.add_argument("--output", help="train-router: model file (defaults to ROUTER_MODEL_PATH)")
+    parser.add_argument("--kind", help="retry-dead-jobs: only requeue jobs of this kind")
+    args = parser.parse_args(argv)
+    return COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
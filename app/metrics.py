@@ -0,0 +1,268 @@
+"""
+Prometheus metrics for Helpdesk-AI.
+
+A small in-process registry rendered in the Prometheus text format at
+``/metrics``, so no client library is needed. Request metrics are recorded by
+``MetricsMiddleware`` (pure ASGI, so streaming responses are timed to their
+last byte); counters kept elsewhere (caches, DB pools) are read by collectors
+only when the endpoint is scraped, keeping the hot path to a few increments.
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Seconds; covers cache hits (sub-millisecond) through slow LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.75, 0.8, 0.9, 0.95, 1.0)
+
+# A sample is (suffix, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """A named metric with a fixed set of label names; children are created per label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "_total", dict(zip(self.label_names, key)), value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", dict(zip(self.label_names, key)), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[tuple, list] = {}  # key -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in values:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                yield "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield "_sum", labels, counts[-1]
+            yield "_count", labels, cumulative
+
+
+# A collector returns (name, kind, help, samples) for values read at scrape time
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Collector) -> Collector:
+        """Register ``fn`` to be called on every scrape (usable as a decorator)."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        families = [(m.name, m.kind, m.help, list(m.samples())) for m in self._metrics]
+        for collect in self._collectors:
+            try:
+                families.extend(collect())
+            except Exception as e:  # A broken collector must not take the endpoint down
+                print(f"⚠️  Metrics collector {getattr(collect, '__name__', collect)} failed: {e}")
+        lines = []
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests_in_flight = registry.register(Gauge(
+    "helpdesk_http_requests_in_flight", "HTTP requests currently being served"))
+http_request_duration = registry.register(Histogram(
+    "helpdesk_http_request_duration_seconds", "HTTP request latency until the last response byte",
+    ["method", "route", "status"]))
+llm_call_duration = registry.register(Histogram(
+    "helpdesk_llm_call_duration_seconds", "Upstream LLM call latency by outcome (answer, escalate, error)",
+    ["outcome"]))
+decision_confidence = registry.register(Histogram(
+    "helpdesk_decision_confidence", "Confidence of AI decisions by source (llm, cache, retrieval, router)",
+    ["source"], buckets=CONFIDENCE_BUCKETS))
+db_pool_checkouts = registry.register(Counter(
+    "helpdesk_db_pool_checkouts", "Connections checked out of the database pool", ["engine"]))
+
+
+def observe_decision(decision: Dict, source: str) -> None:
+    decision_confidence.observe(float(decision.get("confidence") or 0.0), source=source)
+
+
+class MetricsMiddleware:
+    """
+    Records in-flight requests and latency by method, route template and
+    status. Requests that match no route share route="unmatched", so label
+    cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", None) or "unmatched",
+                status=str(status),
+            )
+
+
+pools: List[Tuple[str, Engine]] = []
+
+
+def instrument_pool(engine: Engine, name: str) -> None:
+    """Count checkouts and report pool usage for ``engine`` (a sync Engine)."""
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        db_pool_checkouts.inc(engine=name)
+
+    pools.append((name, engine))
+
+
+@registry.collector
+def _pool_usage():
+    families = {
+        "helpdesk_db_pool_size": ("Configured pool size", "size"),
+        "helpdesk_db_pool_checked_out": ("Connections currently checked out", "checkedout"),
+        "helpdesk_db_pool_overflow": ("Connections open beyond the pool size (negative while below it)", "overflow"),
+    }
+    for name, (help, method) in families.items():
+        samples = []
+        for engine_name, engine in pools:
+            fn = getattr(engine.pool, method, None)
+            if fn is not None:
+                samples.append(("", {"engine": engine_name}, fn()))
+        yield name, "gauge", help, samples
+
+
+def cache_collector(caches: Callable[[], Dict[str, Optional[Dict]]]) -> Collector:
+    """Collector for hit/miss counters and hit ratio of the caches ``caches()`` returns stats for."""
+    def collect():
+        stats = {name: s for name, s in caches().items() if s is not None}
+        yield ("helpdesk_cache_hits", "counter", "Cache hits",
+               [("_total", {"cache": name}, s.get("hits", 0)) for name, s in stats.items()])
+        yield ("helpdesk_cache_misses", "counter", "Cache misses",
+               [("_total", {"cache": name}, s.get("misses", 0)) for name, s in stats.items()])
+        yield ("helpdesk_cache_hit_ratio", "gauge", "Cache hits over lookups since start",
+               [("", {"cache": name}, s.get("hit_ratio", 0.0)) for name, s in stats.items()])
+    return collect
@@ -0,0 +1,121 @@
+"""
+Versioned schema migrations for Helpdesk-AI.
+
+``Base.metadata.create_all`` only creates missing tables, so databases created
+by an older release never pick up new indexes or columns. Each migration here
+runs once per database and is recorded in ``schema_migrations``. Migrations must
+be idempotent: fresh databases already get the latest schema from create_all
+and then record every migration as applied.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, List
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, insert, select
+from sqlalchemy.engine import Connection, Engine
+from . import crud, models
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+# Arbitrary key so concurrent workers on Postgres migrate one at a time
+_PG_LOCK_KEY = 7_304_117
+
+
+@dataclass
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Register a migration function under ``version``."""
+    def register(fn: Callable[[Connection], None]):
+        MIGRATIONS.append(Migration(version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return register
+
+
+def add_column_if_missing(conn: Connection, table: str, column: str, ddl: str) -> None:
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+# ---------- Migrations ----------
+
+@migration(1, "Composite indexes for hot query shapes")
+def _hot_query_indexes(conn: Connection) -> None:
+    for statement in [
+        "CREATE INDEX IF NOT EXISTS ix_messages_conversation_id_role_created_at "
+        "ON messages (conversation_id, role, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_messages_conversation_id_created_at "
+        "ON messages (conversation_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_conversations_user_id_updated_at "
+        "ON conversations (user_id, updated_at)",
+        "CREATE INDEX IF NOT EXISTS ix_tickets_status_created_at ON tickets (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_tickets_created_at ON tickets (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_tickets_user_id ON tickets (user_id)",
+    ]:
+        conn.exec_driver_sql(statement)
+
+
+@migration(2, "Denormalized latest exchange on conversations")
+def _conversation_summaries(conn: Connection) -> None:
+    table = models.Conversation.__table__
+    for name in ("last_question", "last_question_at", "last_answer", "last_answer_at"):
+        add_column_if_missing(conn, table.name, name, table.c[name].type.compile(dialect=conn.dialect))
+    crud.backfill_conversation_summaries(conn)
+
+
+@migration(3, "Ticket resolutions")
+def _ticket_resolution(conn: Connection) -> None:
+    add_column_if_missing(conn, "tickets", "resolution", "TEXT")
+
+
+@migration(4, "Near-duplicate ticket tracking")
+def _ticket_duplicates(conn: Connection) -> None:
+    add_column_if_missing(conn, "tickets", "duplicate_of_id", "INTEGER REFERENCES tickets (id)")
+    add_column_if_missing(conn, "tickets", "duplicate_count", "INTEGER NOT NULL DEFAULT 0")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_tickets_duplicate_of_id ON tickets (duplicate_of_id)")
+
+
+# ---------- Runner ----------
+
+def applied_versions(conn: Connection) -> set:
+    schema_migrations.create(conn, checkfirst=True)
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def upgrade(engine: Engine) -> List[Migration]:
+    """Apply pending migrations in order; returns the ones that ran."""
+    ran = []
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({_PG_LOCK_KEY})")
+        done = applied_versions(conn)
+        for m in MIGRATIONS:
+            if m.version in done:
+                continue
+            m.upgrade(conn)
+            conn.execute(insert(schema_migrations).values(version=m.version, description=m.description))
+            ran.append(m)
+    return ran
+
+
+def pending(engine: Engine) -> List[Migration]:
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    return [m for m in MIGRATIONS if m.version not in done]
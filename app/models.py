@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, func, ForeignKey, Enum
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, func, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from .db import Base
 import enum
@@ -34,6 +34,9 @@ class Ticket(Base):
     title = Column(String(200), nullable=False)
     description = Column(Text, nullable=True)
     status = Column(String(50), default="open")
+    resolution = Column(Text, nullable=True)  # How the issue was solved; reused for similar questions
+    duplicate_of_id = Column(Integer, ForeignKey("tickets.id"), nullable=True)  # Flagged near-duplicate of
+    duplicate_count = Column(Integer, nullable=False, default=0, server_default="0")  # Reports attached to this ticket
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(
         DateTime(timezone=True),
@@ -49,6 +52,14 @@ class Ticket(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=True)
     conversation = relationship("Conversation", back_populates="escalated_ticket")
 
+    # Keep in sync with app/migrations.py
+    __table_args__ = (
+        Index("ix_tickets_status_created_at", "status", "created_at"),
+        Index("ix_tickets_created_at", "created_at"),
+        Index("ix_tickets_user_id", "user_id"),
+        Index("ix_tickets_duplicate_of_id", "duplicate_of_id"),
+    )
+
 class Conversation(Base):
     __tablename__ = "conversations"
 
@@ -65,11 +76,21 @@ class Conversation(Base):
     # Optional: link to user (null for anonymous conversations)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     user = relationship("User", back_populates="conversations")
+
+    # Denormalized latest exchange for /history, maintained by crud on every message write
+    last_question = Column(Text, nullable=True)  # Latest USER message
+    last_question_at = Column(DateTime(timezone=True), nullable=True)
+    last_answer = Column(Text, nullable=True)  # First ASSISTANT reply after last_question
+    last_answer_at = Column(DateTime(timezone=True), nullable=True)
     
     # Relationships
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
     escalated_ticket = relationship("Ticket", back_populates="conversation", uselist=False)
 
+    __table_args__ = (
+        Index("ix_conversations_user_id_updated_at", "user_id", "updated_at"),
+    )
+
 class Message(Base):
     __tablename__ = "messages"
 
@@ -85,3 +106,34 @@ class Message(Base):
     # Optional metadata for AI responses
     ai_confidence = Column(Integer, nullable=True)  # 0-100 confidence score
     ai_action = Column(String(50), nullable=True)  # "answer", "escalate", etc.
+
+    __table_args__ = (
+        Index("ix_messages_conversation_id_role_created_at", "conversation_id", "role", "created_at"),
+        Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at", "id"),
+    )
+
+class RevokedToken(Base):
+    """Access tokens revoked before expiry (logout); loaded into memory at startup."""
+    __tablename__ = "revoked_tokens"
+
+    fingerprint = Column(String(64), primary_key=True)  # sha256 of the token, never the token itself
+    expires_at = Column(Integer, nullable=False)  # Unix time of the token's exp; pruned afterwards
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Job(Base):
+    """Deferred background work, run by the worker in app/jobs.py."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON arguments for the handler
+    status = Column(String(20), nullable=False, default="pending")  # "pending", "running" or "dead"
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    run_at = Column(Float, nullable=False)  # Unix time the job is due (pushed back on retry)
+    locked_at = Column(Float, nullable=True)  # Unix time a worker claimed it
+    locked_by = Column(String(32), nullable=True)  # Claim token of that worker
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (Index("ix_jobs_status_run_at", "status", "run_at"),)
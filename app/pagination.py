@@ -0,0 +1,85 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is an opaque, URL-safe token wrapping the sort key of the last row
+on a page, ``(timestamp, id)``. The next page is everything strictly after
+that key, so deep pages cost the same as the first one and rows inserted
+meanwhile never shift results.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from sqlalchemy import String, literal, tuple_
+from sqlalchemy.orm import Query, Session
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    raw = json.dumps([sort_value.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+
+def _bind_timestamp(db: Session, value: datetime) -> Any:
+    """
+    Bind a cursor timestamp so it compares correctly with stored values.
+
+    SQLite keeps CURRENT_TIMESTAMP defaults as 'YYYY-MM-DD HH:MM:SS' text, while
+    a bound datetime is rendered with microseconds; comparing the two strings
+    would misorder equal timestamps, so bind the stored text form instead.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return value
+    text = value.strftime("%Y-%m-%d %H:%M:%S")
+    if value.microsecond:
+        text += value.strftime(".%f")
+    return literal(text, type_=String)
+
+
+def keyset_page(
+    db: Session,
+    query: Query,
+    sort_column,
+    id_column,
+    limit: int,
+    cursor: Optional[str] = None,
+    descending: bool = True,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Apply keyset pagination on ``(sort_column, id_column)`` to an ORM query.
+
+    Returns the page of rows and the cursor for the next page (None on the last page).
+    """
+    if limit < 1:
+        return [], None
+    key = tuple_(sort_column, id_column)
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        after = tuple_(_bind_timestamp(db, sort_value), row_id)
+        query = query.filter(key < after if descending else key > after)
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), last.id)
+    return rows, next_cursor
@@ -0,0 +1,338 @@
+"""
+LLM providers for Helpdesk-AI.
+
+A provider turns chat messages into the model's raw JSON reply, either whole
+(``complete``) or as text fragments (``stream``); building the prompt and
+parsing the decision stay in ``ai``. Two kinds exist:
+
+- ``openai``: any OpenAI-compatible chat completions API at ``groq_base_url``
+  (Groq by default), behind the retry / circuit breaker policy.
+- ``fake``: an in-process stand-in that answers deterministically after
+  ``llm_fake_latency_seconds``, for load tests and offline development.
+
+``chain`` tries ``groq_model`` and then each of ``llm_fallback_models`` in
+order, moving on whenever a provider fails with an LLMError.
+"""
+
+import asyncio
+import json
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import httpx
+from . import resilience
+from .cache import normalize_message
+from .config import settings
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide LLM HTTP client, creating it on first use.
+
+    The client keeps connections alive between calls so assist requests
+    skip DNS, TCP and TLS setup once the pool is warm.
+    """
+    global _http_client
+    if _http_client is None:
+        http2 = settings.groq_http2 and _http2_available()
+        if settings.groq_http2 and not http2:
+            print("⚠️  GROQ_HTTP2 is enabled but 'h2' is not installed; using HTTP/1.1")
+        _http_client = httpx.AsyncClient(
+            base_url=settings.groq_base_url,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.groq_max_connections,
+                max_keepalive_connections=settings.groq_max_keepalive_connections,
+                keepalive_expiry=settings.groq_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=settings.groq_connect_timeout,
+                read=settings.groq_read_timeout,
+                write=settings.groq_write_timeout,
+                pool=settings.groq_pool_timeout,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client and its pooled connections."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class Provider(ABC):
+    """One model behind one backend, with call, error and latency counters."""
+
+    kind = ""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.name = f"{self.kind}:{model}"
+        self.latency = resilience.LatencyTracker()
+        self.calls = 0
+        self.errors = 0
+
+    @abstractmethod
+    async def _complete(self, messages: List[Dict[str, str]]) -> str:
+        ...
+
+    @abstractmethod
+    def _stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        ...
+
+    async def complete(self, messages: List[Dict[str, str]]) -> str:
+        """The model's full reply to ``messages``."""
+        self.calls += 1
+        start = time.perf_counter()
+        try:
+            content = await self._complete(messages)
+        except Exception:
+            self.errors += 1
+            raise
+        self.latency.record(time.perf_counter() - start)
+        return content
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """The model's reply as text fragments; latency is measured to the last fragment."""
+        self.calls += 1
+        start = time.perf_counter()
+        try:
+            async for fragment in self._stream(messages):
+                yield fragment
+        except GeneratorExit:
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        self.latency.record(time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.latency.percentile(50), self.latency.percentile(95)
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class OpenAICompatibleProvider(Provider):
+    """
+    Chat completions in JSON mode over the shared HTTP client. Each model has
+    its own UpstreamPolicy, so a failing model's circuit opens without
+    affecting its fallbacks.
+    """
+
+    kind = "openai"
+
+    def __init__(self, model: str):
+        super().__init__(model)
+        self.policy = resilience.UpstreamPolicy(self.name)
+
+    def _payload(self, messages: List[Dict[str, str]], stream: bool = False) -> Dict[str, Any]:
+        payload = {
+            "model": self.model,
+            "temperature": 0,
+            "response_format": {"type": "json_object"},
+            "messages": messages
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    @staticmethod
+    def _headers() -> Dict[str, str]:
+        if not settings.groq_api_key:
+            raise ValueError("GROQ_API_KEY not configured")
+        return {
+            "Authorization": f"Bearer {settings.groq_api_key}",
+            "Content-Type": "application/json"
+        }
+
+    async def _request(self, messages: List[Dict[str, str]]) -> str:
+        """One request; raises LLMError (retryable for 429, 5xx and timeouts)."""
+        client = get_http_client()
+        try:
+            response = await client.post("/chat/completions", json=self._payload(messages), headers=self._headers())
+        except httpx.HTTPError as e:
+            raise resilience.error_from_exception(e)
+        if response.is_error:
+            raise resilience.error_from_response(response)
+        try:
+            return response.json()["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise resilience.LLMError(f"Unexpected response from {self.name}")
+
+    async def _open_stream(self, messages: List[Dict[str, str]]) -> httpx.Response:
+        """Start one streaming request; the caller must close the returned response."""
+        client = get_http_client()
+        request = client.build_request(
+            "POST", "/chat/completions", json=self._payload(messages, stream=True), headers=self._headers()
+        )
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            raise resilience.error_from_exception(e)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            raise resilience.error_from_response(response)
+        return response
+
+    async def _complete(self, messages: List[Dict[str, str]]) -> str:
+        self._headers()  # A missing API key is a configuration error, not an upstream failure
+        return await self.policy.call(lambda: self._request(messages))
+
+    async def _stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Retried only until the response starts; never hedged."""
+        self._headers()
+        response = await self.policy.call(lambda: self._open_stream(messages), hedge=False)
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                choices = chunk.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content") or ""
+                if delta:
+                    yield delta
+        except httpx.HTTPError as e:
+            raise resilience.error_from_exception(e)
+        finally:
+            await response.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "upstream": self.policy.stats()}
+
+
+class FakeProvider(Provider):
+    """
+    Deterministic local stand-in: the same question always gets the same
+    decision (about one in four escalates), after a fixed latency.
+    """
+
+    kind = "fake"
+
+    CHUNK = 16  # Characters per streamed fragment
+
+    def reply(self, messages: List[Dict[str, str]]) -> str:
+        question = normalize_message(messages[-1]["content"])
+        h = zlib.crc32(question.encode("utf-8"))
+        title = " ".join(question.split()[:6]).capitalize() or "Support Issue"
+        if h % 4 == 0:
+            decision = {"action": "escalate", "confidence": 0.3, "short_title": title, "reply_text": ""}
+        else:
+            decision = {
+                "action": "answer",
+                "confidence": round(0.8 + (h % 20) / 100, 2),
+                "short_title": title,
+                "reply_text": f"Here is what usually helps with \"{title}\": restart the device and try again.",
+            }
+        return json.dumps(decision)
+
+    async def _complete(self, messages: List[Dict[str, str]]) -> str:
+        await asyncio.sleep(settings.llm_fake_latency_seconds)
+        return self.reply(messages)
+
+    async def _stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        content = self.reply(messages)
+        fragments = [content[i:i + self.CHUNK] for i in range(0, len(content), self.CHUNK)]
+        for fragment in fragments:
+            await asyncio.sleep(settings.llm_fake_latency_seconds / len(fragments))
+            yield fragment
+
+
+PROVIDERS = {
+    OpenAICompatibleProvider.kind: OpenAICompatibleProvider,
+    FakeProvider.kind: FakeProvider,
+}
+
+
+class ProviderChain:
+    """Providers tried in order; the next one is used when a provider raises LLMError."""
+
+    def __init__(self, providers: List[Provider]):
+        self.providers = providers
+        self.fallbacks = 0
+
+    @property
+    def primary(self) -> Provider:
+        return self.providers[0]
+
+    async def complete(self, messages: List[Dict[str, str]]) -> Tuple[str, str]:
+        """The name of the provider that answered, and its reply."""
+        error = None
+        for provider in self.providers:
+            if error is not None:
+                self.fallbacks += 1
+                print(f"⚠️  {error}; falling back to {provider.name}")
+            try:
+                return provider.name, await provider.complete(messages)
+            except resilience.LLMError as e:
+                error = e
+        raise error
+
+    async def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[Tuple[str, str]]:
+        """(provider name, fragment) pairs; falls back only while no fragment has been yielded."""
+        error = None
+        for provider in self.providers:
+            if error is not None:
+                self.fallbacks += 1
+                print(f"⚠️  {error}; falling back to {provider.name}")
+            fragments = provider.stream(messages)
+            try:
+                first = await fragments.__anext__()
+            except StopAsyncIteration:
+                return
+            except resilience.LLMError as e:
+                await fragments.aclose()
+                error = e
+                continue
+            try:
+                yield provider.name, first
+                async for fragment in fragments:
+                    yield provider.name, fragment
+            finally:
+                await fragments.aclose()
+            return
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fallbacks": self.fallbacks,
+            "providers": [provider.stats() for provider in self.providers],
+        }
+
+
+def build_chain() -> ProviderChain:
+    """The chain configured by ``llm_provider``, ``groq_model`` and ``llm_fallback_models``."""
+    if settings.llm_provider not in PROVIDERS:
+        raise ValueError(f"Unknown LLM_PROVIDER {settings.llm_provider!r} (expected one of {', '.join(PROVIDERS)})")
+    cls = PROVIDERS[settings.llm_provider]
+    models = [settings.groq_model] + [m.strip() for m in settings.llm_fallback_models.split(",") if m.strip()]
+    return ProviderChain([cls(model) for model in dict.fromkeys(models)])
+
+
+chain = build_chain()
+
+
+def stats() -> Dict[str, Any]:
+    return {"provider": settings.llm_provider, **chain.stats()}
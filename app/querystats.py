@@ -0,0 +1,143 @@
+"""
+Per-request SQL instrumentation.
+
+Engine events time every statement. While a request is being served,
+``QueryStatsMiddleware`` keeps a tally in a context variable (shared with the
+threadpool running sync routes and with the async engine's greenlets), then:
+
+- adds ``Server-Timing: db;dur=<ms>;desc="<n> queries"`` to the response,
+- records queries and DB time per request by route in /metrics,
+- in debug mode, warns when a request issues more than
+  ``query_count_warn_threshold`` statements, naming the most repeated one
+  (the usual N+1 signature).
+
+Statements slower than ``slow_query_ms`` are logged wherever they run, with
+parameter values redacted to their types.
+"""
+
+import re
+import time
+from collections import Counter as Tally
+from contextvars import ContextVar
+from typing import Any, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from . import metrics
+from .config import settings
+
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+db_queries_per_request = metrics.registry.register(metrics.Histogram(
+    "helpdesk_db_queries_per_request", "SQL statements issued per HTTP request", ["route"],
+    buckets=QUERY_COUNT_BUCKETS))
+db_time_per_request = metrics.registry.register(metrics.Histogram(
+    "helpdesk_db_time_per_request_seconds", "Time spent in SQL statements per HTTP request", ["route"]))
+db_slow_queries = metrics.registry.register(metrics.Counter(
+    "helpdesk_db_slow_queries", "SQL statements slower than SLOW_QUERY_MS"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class RequestQueries:
+    """Statements issued while serving one request."""
+
+    __slots__ = ("label", "count", "seconds", "statements")
+
+    def __init__(self, label: str, track_statements: bool):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: Optional[Tally] = Tally() if track_statements else None
+
+
+current: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+def redact(parameters: Any, executemany: bool = False) -> str:
+    """Parameter types (and string lengths), never their values."""
+    if executemany:
+        return f"<{len(parameters)} parameter sets>"
+
+    def describe(value):
+        if value is None:
+            return "None"
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}({len(value)})"
+        return type(value).__name__
+
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {describe(v)}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "[" + ", ".join(describe(v) for v in parameters) + "]"
+    return describe(parameters)
+
+
+def _compact(statement: str, limit: int = 1000) -> str:
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start_time")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+
+    stats = current.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        if stats.statements is not None:
+            stats.statements[statement] += 1
+
+    if settings.slow_query_ms and elapsed * 1000 >= settings.slow_query_ms:
+        db_slow_queries.inc()
+        where = f" during {stats.label}" if stats is not None else ""
+        print(f"🐢 Slow query ({elapsed * 1000:.1f} ms){where}: {_compact(statement)} "
+              f"| params: {redact(parameters, executemany)}")
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement on ``engine`` (a sync Engine, or an AsyncEngine's sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryStatsMiddleware:
+    """Tally each request's SQL statements; see the module docstring."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueries(f"{scope['method']} {scope['path']}", track_statements=settings.debug)
+        token = current.set(stats)
+
+        async def send_with_timing(message):
+            # Statements issued while a streaming body is sent are not in the header
+            if message["type"] == "http.response.start" and settings.server_timing_enabled:
+                timing = f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"'
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            if settings.metrics_enabled:
+                db_queries_per_request.observe(stats.count, route=route)
+                db_time_per_request.observe(stats.seconds, route=route)
+            if stats.statements is not None and stats.count > settings.query_count_warn_threshold:
+                statement, repeats = stats.statements.most_common(1)[0]
+                print(f"⚠️  {stats.label} issued {stats.count} queries (threshold "
+                      f"{settings.query_count_warn_threshold}); possible N+1, most repeated "
+                      f"({repeats}x): {_compact(statement, 300)}")
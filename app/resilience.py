@@ -0,0 +1,277 @@
+"""
+Resilience policy for upstream LLM calls.
+
+``UpstreamPolicy.call`` wraps a single-attempt coroutine with:
+
+- retries for retryable failures (429, 5xx, timeouts, dropped connections)
+  using full-jitter exponential backoff, or the upstream's Retry-After when
+  it sends one;
+- a circuit breaker that fails fast with LLMUnavailable after repeated
+  failures, then lets one trial request through once the reset time passes;
+- optional hedging: when an attempt is slower than a recent latency
+  percentile, a second identical request is started and whichever answers
+  first wins (the other is cancelled).
+"""
+
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+import httpx
+from fastapi import HTTPException, status
+from .config import settings
+
+
+class LLMError(Exception):
+    """An upstream LLM call failed; ``retryable`` failures may succeed if tried again."""
+
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = False,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class LLMUnavailable(LLMError):
+    """The upstream is unhealthy (circuit open or retries exhausted); callers should back off."""
+
+
+def http_error(e: LLMError) -> HTTPException:
+    """503 with Retry-After while the upstream is unavailable, 502 for other upstream failures."""
+    if isinstance(e, LLMUnavailable):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The AI service is temporarily unavailable, please retry shortly",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after or 1)))},
+        )
+    return HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"AI service error: {e}")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds form only)."""
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
+
+
+def error_from_response(response: httpx.Response, prefix: str = "LLM API error") -> LLMError:
+    """LLMError for a failed HTTP response; 429 and 5xx are retryable."""
+    code = response.status_code
+    try:
+        body = response.text
+    except httpx.ResponseNotRead:
+        body = ""
+    return LLMError(
+        f"{prefix}: {code} - {body[:500]}",
+        status=code,
+        retryable=code == 429 or code >= 500,
+        retry_after=parse_retry_after(response.headers.get("Retry-After")),
+    )
+
+
+def error_from_exception(e: Exception, prefix: str = "LLM API") -> LLMError:
+    """LLMError for a transport failure; timeouts and connection errors are retryable."""
+    if isinstance(e, LLMError):
+        return e
+    if isinstance(e, httpx.HTTPStatusError):
+        return error_from_response(e.response, f"{prefix} error")
+    if isinstance(e, httpx.TimeoutException):
+        return LLMError(f"{prefix} timeout", retryable=True)
+    if isinstance(e, httpx.TransportError):
+        return LLMError(f"{prefix} connection error: {e}", retryable=True)
+    return LLMError(f"Failed to call {prefix}: {e}")
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failures`` consecutive retryable failures and rejects calls
+    for ``reset_seconds``; then one trial call is let through (half-open) and
+    its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failures: Callable[[], int], reset_seconds: Callable[[], float]):
+        self._failures = failures
+        self._reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + self._reset_seconds() - time.monotonic(), 0.0)
+
+    def before_call(self) -> None:
+        """Raise LLMUnavailable unless a call may go upstream now."""
+        if self.state == "open":
+            if self.retry_after() > 0:
+                self.rejected += 1
+                raise LLMUnavailable("LLM upstream unavailable (circuit open)", retry_after=self.retry_after())
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                self.rejected += 1
+                raise LLMUnavailable("LLM upstream unavailable (circuit half-open)", retry_after=1.0)
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_cancelled(self) -> None:
+        """The call was abandoned before an outcome; let the next one be the trial."""
+        self._trial_in_flight = False
+
+    def record_failure(self, error: LLMError) -> None:
+        trial = self._trial_in_flight
+        self._trial_in_flight = False
+        if not error.retryable:
+            if trial:
+                self.state = "closed"  # The upstream answered; the request itself was bad
+            return
+        self.consecutive_failures += 1
+        if trial or self.consecutive_failures >= self._failures():
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Recent successful call durations, for the hedging threshold."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class UpstreamPolicy:
+    """Retries, circuit breaker and hedging for one upstream; settings are read per call."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(lambda: settings.groq_breaker_failures,
+                                      lambda: settings.groq_breaker_reset_seconds)
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        if not settings.groq_hedge_enabled or len(self.latency) < settings.groq_hedge_min_samples:
+            return None
+        return self.latency.percentile(settings.groq_hedge_percentile)
+
+    def backoff(self, attempt: int, error: LLMError) -> Optional[float]:
+        """Seconds to wait before retry ``attempt`` (1-based), or None to give up."""
+        if error.retry_after is not None:
+            delay = error.retry_after + random.uniform(0, settings.groq_retry_base_seconds)
+        else:
+            delay = random.uniform(0, settings.groq_retry_base_seconds * 2 ** (attempt - 1))
+        return delay if delay <= settings.groq_retry_max_seconds else None
+
+    async def _hedged(self, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``attempt``, racing a second copy if the first is slower than the hedge delay."""
+        delay = self.hedge_delay()
+        if delay is None:
+            return await attempt()
+
+        first = asyncio.ensure_future(attempt())
+        pending = {first}
+        error = None
+        try:
+            # Cancelling the caller must not leave either request running orphaned
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                pending = set()
+                return first.result()
+
+            self.hedges += 1
+            second = asyncio.ensure_future(attempt())
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, attempt: Callable[[], Awaitable[Any]], hedge: bool = True) -> Any:
+        """
+        Run ``attempt`` (one upstream request raising LLMError on failure)
+        under the policy. Raises LLMUnavailable when the circuit is open or
+        retryable failures persist, LLMError for other failures.
+
+        Pass ``hedge=False`` when the result holds a resource a losing hedge
+        would leak (an open streaming response); such calls also stay out of
+        the latency samples.
+        """
+        self.calls += 1
+        tries = 0
+        while True:
+            self.breaker.before_call()
+            start = time.perf_counter()
+            try:
+                result = await (self._hedged(attempt) if hedge else attempt())
+            except asyncio.CancelledError:
+                self.breaker.record_cancelled()
+                raise
+            except Exception as e:
+                error = error_from_exception(e)
+                self.breaker.record_failure(error)
+                tries += 1
+                wait = self.backoff(tries, error) if error.retryable and tries <= settings.groq_max_retries else None
+                if wait is None:
+                    self.failures += 1
+                    if error.retryable:
+                        raise LLMUnavailable(str(error), status=error.status, retryable=True,
+                                             retry_after=error.retry_after or self.breaker.retry_after() or None) from e
+                    raise error from e
+                self.retries += 1
+                await asyncio.sleep(wait)
+                continue
+            self.breaker.record_success()
+            if hedge:
+                self.latency.record(time.perf_counter() - start)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.latency.percentile(50), self.latency.percentile(95)
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "circuit_opened": self.breaker.opened,
+            "circuit_rejected": self.breaker.rejected,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
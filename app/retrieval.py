@@ -0,0 +1,368 @@
+"""
+Retrieval over resolved tickets.
+
+Closed tickets with a resolution form a small TF-IDF index: each ticket's
+title and description become a sparse vector of hashed word unigrams and
+bigrams, stored CSR-style in NumPy arrays. A question that closely matches a
+resolved ticket is answered with that ticket's resolution without calling the
+LLM; weaker matches can be passed to the LLM as context.
+
+Hashing keeps the feature space fixed, so tickets are added or removed without
+re-indexing the rest. The arrays persist as .npy files that are memory-mapped
+on load, so a restarted worker starts warm.
+"""
+
+import json
+import os
+import shutil
+import threading
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import models
+from .cache import normalize_message
+from .config import settings
+
+# Size of the hashed feature space; crc32 keeps hashes stable across processes
+DIM = 1 << 18
+
+RESOLVED_STATUS = "closed"
+
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from have how i in is it its me my "
+    "of on or our please so that the this to was we what when where which why with you your".split()
+)
+
+_ARRAYS = ("ticket_ids", "indptr", "indices", "weights")
+
+
+def features(text: str) -> Counter:
+    """Hashed unigram and bigram counts of ``text``."""
+    words = [w for w in normalize_message(text).split() if w not in _STOPWORDS]
+    terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return Counter(zlib.crc32(term.encode("utf-8")) % DIM for term in terms)
+
+
+def ticket_text(ticket: models.Ticket) -> str:
+    return f"{ticket.title}\n{ticket.description or ''}"
+
+
+def is_resolved(ticket: models.Ticket) -> bool:
+    return ticket.status == RESOLVED_STATUS and bool((ticket.resolution or "").strip())
+
+
+class RetrievalIndex:
+    """
+    TF-IDF index of resolved tickets with cosine-similarity search.
+
+    Rows hold sublinear term weights (1 + log tf); IDF and row norms depend on
+    the whole collection and are recomputed lazily after each change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ticket_ids = np.zeros(0, dtype=np.int64)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float32)
+        self.answers: Dict[int, Dict[str, str]] = {}  # ticket id -> title, resolution
+        self._derived: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self.searches = 0
+        self.answered = 0
+
+    def __len__(self) -> int:
+        return len(self.ticket_ids)
+
+    # ---------- Updates ----------
+
+    def _replace(self, ticket_ids, indptr, indices, weights) -> None:
+        self.ticket_ids, self.indptr, self.indices, self.weights = ticket_ids, indptr, indices, weights
+        self._derived = None
+
+    def _without(self, ticket_id: int):
+        """Arrays with ``ticket_id``'s row removed."""
+        rows = np.flatnonzero(self.ticket_ids == ticket_id)
+        if not len(rows):
+            return self.ticket_ids, self.indptr, self.indices, self.weights
+        row = int(rows[0])
+        start, end = int(self.indptr[row]), int(self.indptr[row + 1])
+        return (
+            np.delete(self.ticket_ids, row),
+            np.concatenate([self.indptr[:row + 1], self.indptr[row + 2:] - (end - start)]),
+            np.concatenate([self.indices[:start], self.indices[end:]]),
+            np.concatenate([self.weights[:start], self.weights[end:]]),
+        )
+
+    @staticmethod
+    def _row(text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted feature columns of ``text`` and their sublinear term weights."""
+        counts = features(text)
+        cols = np.array(sorted(counts), dtype=np.int32)
+        vals = np.array([1.0 + np.log(counts[c]) for c in cols], dtype=np.float32)
+        return cols, vals
+
+    def upsert(self, ticket_id: int, text: str, title: str, resolution: str) -> None:
+        cols, vals = self._row(text)
+        with self._lock:
+            ticket_ids, indptr, indices, weights = self._without(ticket_id)
+            self._replace(
+                np.append(ticket_ids, np.int64(ticket_id)),
+                np.append(indptr, indptr[-1] + len(cols)),
+                np.concatenate([indices, cols]),
+                np.concatenate([weights, vals]),
+            )
+            self.answers[ticket_id] = {"title": title, "resolution": resolution}
+
+    def remove(self, ticket_id: int) -> bool:
+        with self._lock:
+            if ticket_id not in self.answers:
+                return False
+            self._replace(*self._without(ticket_id))
+            del self.answers[ticket_id]
+            return True
+
+    def rebuild(self, tickets: List[models.Ticket]) -> None:
+        """Replace the whole index in one swap; searches see the old or the new one."""
+        latest = {ticket.id: ticket for ticket in tickets}  # Last one wins, as with upsert
+        rows = [self._row(ticket_text(ticket)) for ticket in latest.values()]
+        ticket_ids = np.fromiter(latest, dtype=np.int64, count=len(latest))
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(cols) for cols, _ in rows], out=indptr[1:])
+        indices = np.concatenate([cols for cols, _ in rows]) if rows else np.zeros(0, dtype=np.int32)
+        weights = np.concatenate([vals for _, vals in rows]) if rows else np.zeros(0, dtype=np.float32)
+        answers = {t.id: {"title": t.title, "resolution": t.resolution} for t in latest.values()}
+        with self._lock:
+            self._replace(ticket_ids, indptr, indices, weights)
+            self.answers = answers
+
+    # ---------- Search ----------
+
+    def _derive(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(row of each nonzero, idf per feature, row norms), cached until the next change."""
+        if self._derived is None:
+            n = len(self.ticket_ids)
+            rows = np.repeat(np.arange(n), np.diff(self.indptr))
+            df = np.bincount(self.indices, minlength=DIM)
+            idf = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+            norms = np.sqrt(np.bincount(rows, weights=(self.weights * idf[self.indices]) ** 2, minlength=n))
+            self._derived = (rows, idf, norms)
+        return self._derived
+
+    def search(self, text: str, k: int = 1) -> List[Tuple[int, float]]:
+        """Top ``k`` (ticket id, cosine similarity) pairs for ``text``, best first."""
+        counts = features(text)
+        with self._lock:
+            self.searches += 1
+            if not counts or not len(self.ticket_ids):
+                return []
+            rows, idf, norms = self._derive()
+            q_cols = np.array(sorted(counts), dtype=np.int32)
+            q_vals = np.array([1.0 + np.log(counts[c]) for c in q_cols], dtype=np.float32) * idf[q_cols]
+            q_norm = float(np.sqrt(np.dot(q_vals, q_vals)))
+
+            hit = np.isin(self.indices, q_cols)
+            cols = self.indices[hit]
+            contrib = self.weights[hit] * idf[cols] * q_vals[np.searchsorted(q_cols, cols)]
+            scores = np.bincount(rows[hit], weights=contrib, minlength=len(self.ticket_ids))
+            scores = scores / (np.maximum(norms, 1e-12) * q_norm)
+
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(self.ticket_ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    # ---------- Persistence ----------
+
+    def save(self, path: str) -> None:
+        """
+        Write the index under ``path`` as a new generation directory and point
+        ``path/CURRENT`` at it, so readers never see a half-written index.
+        """
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            arrays = {name: np.asarray(getattr(self, name)) for name in _ARRAYS}
+            answers = {str(k): v for k, v in self.answers.items()}
+        generation = f"gen-{os.getpid()}-{threading.get_ident()}-{len(arrays['ticket_ids'])}-{os.urandom(4).hex()}"
+        target = os.path.join(path, generation)
+        os.makedirs(target)
+        for name, array in arrays.items():
+            np.save(os.path.join(target, f"{name}.npy"), array)
+        with open(os.path.join(target, "answers.json"), "w", encoding="utf-8") as f:
+            json.dump(answers, f)
+
+        pointer = os.path.join(path, f"CURRENT.{generation}")
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(generation)
+        os.replace(pointer, os.path.join(path, "CURRENT"))
+
+        # Older generations stay readable through existing memory maps; unlinking is safe
+        for entry in os.listdir(path):
+            if entry.startswith("gen-") and entry != generation:
+                shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+    def load(self, path: str) -> bool:
+        """Memory-map a saved index; returns False if there is none."""
+        try:
+            with open(os.path.join(path, "CURRENT"), encoding="utf-8") as f:
+                source = os.path.join(path, f.read().strip())
+            arrays = [np.load(os.path.join(source, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS]
+            with open(os.path.join(source, "answers.json"), encoding="utf-8") as f:
+                answers = {int(k): v for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            self._replace(*arrays)
+            self.answers = answers
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.retrieval_enabled,
+            "tickets": len(self.ticket_ids),
+            "nonzeros": len(self.indices),
+            "searches": self.searches,
+            "answered": self.answered,
+        }
+
+
+index = RetrievalIndex()
+
+
+def resolved_tickets(db: Session) -> List[models.Ticket]:
+    return list(db.scalars(
+        select(models.Ticket)
+        .where(models.Ticket.status == RESOLVED_STATUS, models.Ticket.resolution.isnot(None))
+        .order_by(models.Ticket.id)
+    ))
+
+
+def build(db: Session) -> int:
+    """Rebuild the index from the database (and persist it if configured)."""
+    index.rebuild([t for t in resolved_tickets(db) if is_resolved(t)])
+    if settings.retrieval_index_path:
+        index.save(settings.retrieval_index_path)
+    return len(index)
+
+
+_save_lock = threading.Lock()
+_save_timer: Optional[threading.Timer] = None
+
+
+def _save_now() -> None:
+    global _save_timer
+    with _save_lock:
+        _save_timer = None
+    try:
+        index.save(settings.retrieval_index_path)
+    except Exception as e:
+        print(f"⚠️  Failed to persist retrieval index: {e}")
+
+
+def schedule_save() -> None:
+    """
+    Persist the index ``retrieval_save_delay_seconds`` after the first pending
+    change, so a burst of ticket updates writes the files once.
+    """
+    global _save_timer
+    if not settings.retrieval_index_path:
+        return
+    if settings.retrieval_save_delay_seconds <= 0:
+        _save_now()
+        return
+    with _save_lock:
+        if _save_timer is not None:
+            return
+        _save_timer = threading.Timer(settings.retrieval_save_delay_seconds, _save_now)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def flush() -> None:
+    """Write a pending save now (on shutdown)."""
+    global _save_timer
+    with _save_lock:
+        timer, _save_timer = _save_timer, None
+    if timer is not None:
+        timer.cancel()
+        index.save(settings.retrieval_index_path)
+
+
+def load_or_build(db: Session) -> int:
+    """Start warm from the persisted index, or build it from the database."""
+    if settings.retrieval_index_path and index.load(settings.retrieval_index_path):
+        return len(index)
+    return build(db)
+
+
+def sync_ticket(ticket: models.Ticket) -> None:
+    """Add, refresh or drop one ticket after it changed."""
+    sync_tickets([ticket])
+
+
+def sync_tickets(tickets: List[models.Ticket], removed_ids: List[int] = ()) -> None:
+    """Apply a batch of changed and deleted tickets, then schedule one save of the index."""
+    if not settings.retrieval_enabled:
+        return
+    changed = False
+    for ticket in tickets:
+        if is_resolved(ticket):
+            index.upsert(ticket.id, ticket_text(ticket), ticket.title, ticket.resolution)
+            changed = True
+        else:
+            changed = index.remove(ticket.id) or changed
+    for ticket_id in removed_ids:
+        changed = index.remove(ticket_id) or changed
+    if changed:
+        schedule_save()
+
+
+def forget_ticket(ticket_id: int) -> None:
+    if index.remove(ticket_id):
+        schedule_save()
+
+
+def answer_for(message: str) -> Optional[Dict[str, Any]]:
+    """
+    A decision answering ``message`` from the closest resolved ticket, or None
+    when no ticket reaches ``retrieval_min_similarity``.
+    """
+    if not settings.retrieval_enabled:
+        return None
+    hits = index.search(message, k=1)
+    if not hits or hits[0][1] < settings.retrieval_min_similarity:
+        return None
+    ticket_id, similarity = hits[0]
+    answer = index.answers.get(ticket_id)
+    if answer is None:
+        return None
+    index.answered += 1
+    return {
+        "action": "answer",
+        "confidence": round(similarity, 4),
+        "short_title": answer["title"],
+        "reply_text": answer["resolution"],
+        "source": "retrieval",
+        "ticket_id": ticket_id,
+    }
+
+
+def context_for(message: str) -> Tuple[str, List[int]]:
+    """
+    Prompt context listing the top ``retrieval_context_k`` resolved tickets
+    similar to ``message``, and their ids (empty when disabled or no match).
+    """
+    if not settings.retrieval_enabled or settings.retrieval_context_k <= 0:
+        return "", []
+    lines, ids = [], []
+    for ticket_id, similarity in index.search(message, k=settings.retrieval_context_k):
+        answer = index.answers.get(ticket_id)
+        if answer is None or similarity < settings.retrieval_context_min_similarity:
+            continue
+        ids.append(ticket_id)
+        lines.append(f"- {answer['title']}: {answer['resolution']}")
+    if not lines:
+        return "", []
+    return "Resolved tickets that may be relevant:\n" + "\n".join(lines), ids
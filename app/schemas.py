@@ -1,7 +1,7 @@
 # app/schemas.py
 from datetime import datetime
 from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
+from typing import List, Literal, Optional
 from .models import ConversationStatus, MessageRole
 
 class TicketBase(BaseModel):
@@ -15,20 +15,61 @@ class TicketUpdate(BaseModel):
     title: str | None = None
     description: str | None = None
     status: str | None = None
+    resolution: str | None = None
 
 class TicketRead(TicketBase):
     id: int
     status: str
+    resolution: str | None = None
+    duplicate_of_id: int | None = None
+    duplicate_count: int = 0
     created_at: datetime
     updated_at: datetime
+    snippet: str | None = None  # Highlighted search excerpt (HTML, matches in <mark>)
 
     model_config = ConfigDict(from_attributes=True)
 
+class TicketPage(BaseModel):
+    items: List[TicketRead]
+    next_cursor: Optional[str] = None
+
+class TicketCluster(BaseModel):
+    size: int
+    tickets: List[TicketRead]
+
+class TicketBulkUpdate(TicketUpdate):
+    id: int
+
+class TicketBulkRequest(BaseModel):
+    creates: List[TicketCreate] = []
+    updates: List[TicketBulkUpdate] = []
+    deletes: List[int] = []
+    mode: Optional[Literal["atomic", "partial"]] = None  # Defaults to settings.tickets_bulk_mode
+
+class TicketBulkItem(BaseModel):
+    op: Literal["create", "update", "delete"]
+    index: int  # Position within its creates / updates / deletes array
+    id: int | None = None
+    ok: bool
+    error: str | None = None
+    ticket: TicketRead | None = None
+
+class TicketBulkResult(BaseModel):
+    mode: str
+    created: int
+    updated: int
+    deleted: int
+    failed: int
+    results: List[TicketBulkItem]
+
 # ---------- AI Assistant Schemas ----------
 
 class AssistRequest(BaseModel):
     message: str
 
+class AssistBatchRequest(BaseModel):
+    messages: List[str]
+
 # ---------- User Schemas ----------
 
 class UserBase(BaseModel):
@@ -76,6 +117,10 @@ class ConversationRead(ConversationBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class ConversationPage(BaseModel):
+    items: List[ConversationRead]
+    next_cursor: Optional[str] = None
+
 # ---------- Message Schemas ----------
 
 class MessageBase(BaseModel):
@@ -95,6 +140,10 @@ class MessageRead(MessageBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class MessagePage(BaseModel):
+    items: List[MessageRead]
+    next_cursor: Optional[str] = None
+
 # ---------- Chat API Schemas ----------
 
 class ChatSendMessage(BaseModel):
@@ -109,6 +158,7 @@ class ChatResponse(BaseModel):
 
 class ConversationWithMessages(ConversationRead):
     messages: List[MessageRead] = []
+    next_cursor: Optional[str] = None  # Set when only the tail was loaded; pages towards older messages
 
     model_config = ConfigDict(from_attributes=True)
 
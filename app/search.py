@@ -0,0 +1,214 @@
+"""
+Full-text search over tickets.
+
+SQLite uses an FTS5 external-content table kept in sync with ``tickets`` by
+triggers; Postgres uses a generated ``tsvector`` column with a GIN index.
+Both rank results by relevance and can return highlighted snippets.
+"""
+
+import html
+import re
+from typing import Dict, List, Optional
+from sqlalchemy import false, func, literal_column, null, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from . import models
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5("
+    "title, description, content='tickets', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS tickets_fts_ai AFTER INSERT ON tickets BEGIN "
+    "INSERT INTO tickets_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS tickets_fts_ad AFTER DELETE ON tickets BEGIN "
+    "INSERT INTO tickets_fts(tickets_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS tickets_fts_au AFTER UPDATE OF title, description ON tickets BEGIN "
+    "INSERT INTO tickets_fts(tickets_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO tickets_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+]
+
+POSTGRES_DDL = [
+    "ALTER TABLE tickets ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_tickets_search_vector ON tickets USING GIN (search_vector)",
+]
+
+# Private-use sentinels wrap matches so snippets can be HTML-escaped safely
+_MARK_START = "\ue000"
+_MARK_END = "\ue001"
+_TERM_RE = re.compile(r"\w+")
+
+_available: Optional[bool] = None
+
+
+def install(conn: Connection) -> None:
+    """Create the full-text index for the connection's dialect."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tickets_fts'"
+        ).first()
+        for statement in SQLITE_DDL:
+            conn.exec_driver_sql(statement)
+        if not exists:
+            # Index rows that existed before the triggers
+            conn.exec_driver_sql("INSERT INTO tickets_fts(tickets_fts) VALUES ('rebuild')")
+    elif dialect == "postgresql":
+        for statement in POSTGRES_DDL:
+            conn.exec_driver_sql(statement)
+    else:
+        raise NotImplementedError(f"Full-text search is not supported on {dialect}")
+
+
+def ensure_index(engine: Engine) -> bool:
+    """Install the index if possible and remember whether full-text search is usable."""
+    global _available
+    try:
+        with engine.begin() as conn:
+            install(conn)
+        _available = True
+    except Exception as e:
+        print(f"⚠️  Ticket full-text search unavailable, using substring search: {e}")
+        _available = False
+    return _available
+
+
+def is_available() -> bool:
+    return bool(_available)
+
+
+def fts5_query(q: str) -> str:
+    """Turn free text into an FTS5 query: every term must match, as a prefix."""
+    return " ".join(f'"{term}"*' for term in _TERM_RE.findall(q))
+
+
+def matching_ticket_ids(db: Session, q: str):
+    """Selectable of ticket ids matching ``q``, for use as a filter without ranking."""
+    if db.get_bind().dialect.name == "sqlite":
+        match = fts5_query(q)
+        if not match:
+            # No searchable terms; an empty MATCH is an FTS5 syntax error
+            return select(models.Ticket.id).where(false())
+        return (
+            select(literal_column("rowid"))
+            .select_from(text("tickets_fts"))
+            .where(text("tickets_fts MATCH :match").bindparams(match=match))
+        )
+    return select(models.Ticket.id).where(
+        literal_column("tickets.search_vector").op("@@")(func.websearch_to_tsquery("english", q))
+    )
+
+
+def snippets(db: Session, q: str, ticket_ids: List[int]) -> Dict[int, Optional[str]]:
+    """Highlighted snippets (as in ``search_tickets``) for already selected tickets matching ``q``."""
+    if not ticket_ids:
+        return {}
+    Ticket = models.Ticket
+    if db.get_bind().dialect.name == "sqlite":
+        match = fts5_query(q)
+        if not match:
+            return {}
+        stmt = (
+            select(
+                literal_column("rowid"),
+                literal_column(f"snippet(tickets_fts, -1, '{_MARK_START}', '{_MARK_END}', '…', 16)"),
+            )
+            .select_from(text("tickets_fts"))
+            .where(text("tickets_fts MATCH :match").bindparams(match=match))
+            .where(literal_column("rowid").in_(ticket_ids))
+        )
+    else:
+        stmt = select(
+            Ticket.id,
+            func.ts_headline(
+                "english",
+                func.coalesce(Ticket.description, Ticket.title),
+                func.websearch_to_tsquery("english", q),
+                f"StartSel={_MARK_START}, StopSel={_MARK_END}, MaxFragments=2, MaxWords=20, MinWords=5",
+            ),
+        ).where(Ticket.id.in_(ticket_ids))
+    return {ticket_id: render_snippet(raw) for ticket_id, raw in db.execute(stmt)}
+
+
+def render_snippet(raw: Optional[str]) -> Optional[str]:
+    """Escape a snippet and turn match sentinels into <mark> tags."""
+    if raw is None:
+        return None
+    escaped = html.escape(raw)
+    return escaped.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def search_tickets(
+    db: Session,
+    q: str,
+    skip: int = 0,
+    limit: int = 100,
+    status: Optional[str] = None,
+    highlight: bool = False,
+) -> List[models.Ticket]:
+    """
+    Return tickets matching ``q`` ordered by relevance.
+
+    With ``highlight`` each ticket gets a ``snippet`` attribute holding an
+    HTML-safe excerpt with matches wrapped in <mark>.
+    """
+    dialect = db.get_bind().dialect.name
+    Ticket = models.Ticket
+
+    if dialect == "sqlite":
+        match = fts5_query(q)
+        if not match:
+            return []
+        snippet = (
+            literal_column(f"snippet(tickets_fts, -1, '{_MARK_START}', '{_MARK_END}', '…', 16)")
+            if highlight
+            else null()
+        )
+        hits = (
+            select(
+                literal_column("rowid").label("id"),
+                literal_column("bm25(tickets_fts, 10.0, 1.0)").label("rank"),
+                snippet.label("snippet"),
+            )
+            .select_from(text("tickets_fts"))
+            .where(text("tickets_fts MATCH :match"))
+            .subquery("hits")
+        )
+        stmt = (
+            select(Ticket, hits.c.snippet)
+            .join(hits, hits.c.id == Ticket.id)
+            .order_by(hits.c.rank, Ticket.created_at.desc())
+        )
+        params = {"match": match}
+    else:
+        query = func.websearch_to_tsquery("english", q)
+        vector = literal_column("tickets.search_vector")
+        snippet = (
+            func.ts_headline(
+                "english",
+                func.coalesce(Ticket.description, Ticket.title),
+                query,
+                f"StartSel={_MARK_START}, StopSel={_MARK_END}, MaxFragments=2, MaxWords=20, MinWords=5",
+            )
+            if highlight
+            else null()
+        )
+        stmt = (
+            select(Ticket, snippet.label("snippet"))
+            .where(vector.op("@@")(query))
+            .order_by(func.ts_rank_cd(vector, query).desc(), Ticket.created_at.desc())
+        )
+        params = {}
+
+    if status:
+        stmt = stmt.where(Ticket.status == status)
+    rows = db.execute(stmt.offset(skip).limit(limit), params).all()
+
+    tickets = []
+    for ticket, raw_snippet in rows:
+        if highlight:
+            ticket.snippet = render_snippet(raw_snippet)
+        tickets.append(ticket)
+    return tickets
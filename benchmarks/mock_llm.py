@@ -0,0 +1,123 @@
+"""
+Mock OpenAI-compatible chat completions server for load tests.
+
+Answers ``POST /chat/completions`` (plain and ``stream: true``) with the same
+deterministic decisions as the in-process fake provider, after a tunable
+latency, so the app's real HTTP client, retries and connection pool are
+exercised without calling Groq.
+
+Usage:
+    python -m benchmarks.mock_llm --port 9100 --latency-ms 300 --jitter-ms 100
+    GROQ_BASE_URL=http://127.0.0.1:9100 GROQ_API_KEY=mock uvicorn app.main:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+import uvicorn
+
+from app.providers import FakeProvider
+
+_reply = FakeProvider("mock").reply
+
+
+class MockLLM:
+    """Pure ASGI app, so the mock itself adds as little overhead as possible."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 stream_chunks: int = 8, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.stream_chunks = max(1, stream_chunks)
+        self._random = random.Random(seed)
+        self.requests = 0
+
+    def _delay(self) -> float:
+        jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(self.latency_ms + jitter, 0.0) / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        if scope["method"] != "POST" or not scope["path"].endswith("/chat/completions"):
+            await self._send(send, 404, b'{"error": "not found"}')
+            return
+
+        self.requests += 1
+        try:
+            payload = json.loads(body)
+            content = _reply(payload["messages"])
+        except (ValueError, KeyError, IndexError, TypeError):
+            await self._send(send, 400, b'{"error": "invalid request"}')
+            return
+
+        delay = self._delay()
+        if self.error_rate and self._random.random() < self.error_rate:
+            await asyncio.sleep(delay)
+            await self._send(send, 503, b'{"error": "mock overload"}')
+            return
+        if payload.get("stream"):
+            await self._stream(send, content, delay, payload.get("model", "mock"))
+            return
+        await asyncio.sleep(delay)
+        await self._send(send, 200, json.dumps({
+            "id": f"mock-{self.requests}",
+            "object": "chat.completion",
+            "model": payload.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        }).encode())
+
+    @staticmethod
+    async def _send(send, status: int, body: bytes, content_type: bytes = b"application/json") -> None:
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", content_type)]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _stream(self, send, content: str, delay: float, model: str) -> None:
+        """Spread ``delay`` over the chunks: half before the first token, half across the rest."""
+        size = -(-len(content) // self.stream_chunks)
+        chunks = [content[i:i + size] for i in range(0, len(content), size)]
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream")]})
+        await asyncio.sleep(delay / 2)
+        for chunk in chunks:
+            event = {"object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": chunk}}]}
+            await send({"type": "http.response.body", "body": f"data: {json.dumps(event)}\n\n".encode(),
+                        "more_body": True})
+            await asyncio.sleep(delay / 2 / len(chunks))
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Mean response time")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- spread around the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    args = parser.parse_args()
+
+    app = MockLLM(args.latency_ms, args.jitter_ms, args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()